@@ -0,0 +1,43 @@
+#!/usr/bin/python3
+# Run each module the way Waybar does, with --startup-budget, and report its time to first output.
+import os
+import sys
+import argparse
+import subprocess
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+TIMEOUT = 10
+CHECKS = [  # (argv, budget in ms); a cold usage.py/temp.py also spawns its --serve sampler
+    (["usage.py", "cpu"], 500),
+    (["usage.py", "memory"], 500),
+    (["temp.py", "cpu"], 500),
+    (["power.py", "--daemon"], 500),
+    (["player.py"], 1000),  # gi + Playerctl import
+    (["internet_status.py"], 1500),  # First line after the first probe round
+]
+
+def check(argv, budget):
+    """(passed, message) for one module run with --startup-budget."""
+    cmd = [sys.executable, os.path.join(SCRIPTS_DIR, argv[0])] + argv[1:] + ["--startup-budget", str(budget)]
+    try: proc = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, timeout=TIMEOUT)
+    except subprocess.TimeoutExpired: return False, f"no output within {TIMEOUT} s"
+    report = [line for line in proc.stderr.splitlines() if "first output after" in line]
+    if report: return proc.returncode == 0, report[-1].split(": ", 1)[1]
+    lines = proc.stderr.strip().splitlines()
+    return False, f"exited with status {proc.returncode}" + (f": {lines[-1]}" if lines else "")
+
+def main():
+    parser = argparse.ArgumentParser(description="Check every waybar module's time to first output against its budget")
+    parser.add_argument('scripts', nargs='*', help='Only check these scripts, e.g. usage.py temp.py')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every budget, e.g. 2 on a slow machine')
+    args = parser.parse_args()
+    failed = 0
+    for argv, budget in CHECKS:
+        if args.scripts and argv[0] not in args.scripts: continue
+        passed, message = check(argv, budget * args.scale)
+        failed += not passed
+        print(f"{'ok  ' if passed else 'FAIL'} {' '.join(argv):24} {message}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
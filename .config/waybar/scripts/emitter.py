@@ -0,0 +1,36 @@
+"""Change-only JSON line output for Waybar custom modules."""
+import json
+import sys
+import time
+
+HEARTBEAT = 60
+
+def quantize(value, step):
+    """Round to a multiple of step so sub-step jitter doesn't change the output."""
+    return round(value / step) * step
+
+class Emitter:
+    """Writes a payload only when its serialized form changed, or every `heartbeat` seconds."""
+    def __init__(self, write=None, heartbeat=HEARTBEAT):
+        self.write = write or self.write_stdout
+        self.heartbeat = heartbeat
+        self.last = None
+        self.last_write = 0.0
+
+    @staticmethod
+    def write_stdout(line):
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def changed(self, line):
+        now = time.monotonic()
+        if line == self.last and now - self.last_write < self.heartbeat: return False
+        self.last = line
+        self.last_write = now
+        return True
+
+    def emit(self, payload):
+        line = payload if isinstance(payload, str) else json.dumps(payload)
+        if not self.changed(line): return False
+        self.write(line)
+        return True
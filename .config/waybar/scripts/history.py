@@ -0,0 +1,119 @@
+"""Fixed-size metric history with constant-time window statistics and sparklines."""
+import time
+from array import array
+from emitter import quantize
+
+WINDOWS = (1, 5, 15)  # Minutes
+SPARK_CHARS = "▁▂▃▄▅▆▇█"
+SPARK_LENGTH = 30
+
+def window_sizes(interval, windows):
+    return [max(1, int(minutes * 60 / interval)) for minutes in windows]
+
+class MetricHistory:
+    """Ring of float32 samples sized for the longest window.
+
+    Each window keeps a running sum and a histogram of the samples quantised to `bins`
+    steps over [lo, hi]. A push adds the new sample and evicts the one leaving each
+    window, so the update is O(1) and min/avg/max/p95 never rescan the samples.
+
+    `storage` (e.g. a spool region of storage_size() bytes) holds the sample count and
+    the ring; existing samples in it are picked up and the window state rebuilt once.
+    """
+    def __init__(self, interval, lo=0.0, hi=100.0, bins=100, windows=WINDOWS, storage=None):
+        self.lo, self.hi, self.bins = lo, hi, bins
+        self.interval = interval
+        self.next_slot = None
+        self.windows = windows
+        self.sizes = window_sizes(interval, windows)
+        self.capacity = max(self.sizes)
+        if storage is None: storage = memoryview(bytearray(self.storage_size(interval, windows)))
+        self.meta = storage[:8].cast('Q')
+        self.ring = storage[8:8 + 4 * self.capacity].cast('f')
+        self.count = self.meta[0]
+        self.sums = [0.0] * len(windows)
+        self.hists = [array('I', bytes(4 * (bins + 1))) for _ in windows]
+        self.rebuild()
+
+    @staticmethod
+    def storage_size(interval, windows=WINDOWS):
+        return 8 + 4 * max(window_sizes(interval, windows))
+
+    def rebuild(self):
+        for i, size in enumerate(self.sizes):
+            for k in range(max(0, self.count - size), self.count):
+                value = self.ring[k % self.capacity]
+                self.sums[i] += value
+                self.hists[i][self.bin(value)] += 1
+
+    def bin(self, value):
+        b = int((value - self.lo) / (self.hi - self.lo) * self.bins + 0.5)
+        return 0 if b < 0 else self.bins if b > self.bins else b
+
+    def push(self, value):
+        cap, count = self.capacity, self.count
+        evicted = [self.ring[(count - size) % cap] if count >= size else None for size in self.sizes]
+        idx = count % cap
+        self.ring[idx] = value
+        value = self.ring[idx]  # Add the stored float32 so sums don't drift on eviction
+        new_bin = self.bin(value)
+        for i, old in enumerate(evicted):
+            if old is not None:
+                self.sums[i] -= old
+                self.hists[i][self.bin(old)] -= 1
+            self.sums[i] += value
+            self.hists[i][new_bin] += 1
+        self.count = self.meta[0] = count + 1
+
+    def record(self, value):
+        """Push value once per `interval` elapsed since the last push, so windows stay in wall time
+        when the caller samples faster or slower than the interval."""
+        now = time.monotonic()
+        if self.next_slot is None or now - self.next_slot > self.capacity * self.interval:
+            self.next_slot = now
+        # A quarter-interval of slack absorbs wakeup jitter around aligned deadlines
+        while now + self.interval * 0.25 >= self.next_slot:
+            self.push(value)
+            self.next_slot += self.interval
+
+    def value_of(self, b):
+        return self.lo + b * (self.hi - self.lo) / self.bins
+
+    def stats(self, i):
+        """(min, avg, max, p95) over window i, or None before the first sample."""
+        n = min(self.count, self.sizes[i])
+        if not n: return None
+        hist = self.hists[i]
+        lo = next(b for b in range(self.bins + 1) if hist[b])
+        hi = next(b for b in range(self.bins, -1, -1) if hist[b])
+        target, seen, p95 = 0.95 * n, 0, hi
+        for b in range(lo, hi + 1):
+            seen += hist[b]
+            if seen >= target:
+                p95 = b
+                break
+        return self.value_of(lo), self.sums[i] / n, self.value_of(hi), self.value_of(p95)
+
+    def sparkline(self, length=SPARK_LENGTH):
+        n = min(self.count, length, self.capacity)
+        scale = (len(SPARK_CHARS) - 1) / (self.hi - self.lo)
+        chars = []
+        for k in range(self.count - n, self.count):
+            level = int((self.ring[k % self.capacity] - self.lo) * scale + 0.5)
+            chars.append(SPARK_CHARS[min(max(level, 0), len(SPARK_CHARS) - 1)])
+        return "".join(chars)
+
+    def summary(self, unit="%", fmt=".0f", step=None):
+        """Tooltip lines: the sparkline, then min/avg/max/p95 for each window that has new data.
+
+        step quantizes the figures, so e.g. a running average doesn't change the line every sample.
+        """
+        if not self.count: return []
+        lines = [f" {self.sparkline()}"]
+        shown = [i for i, size in enumerate(self.sizes) if i == 0 or self.count > self.sizes[i - 1]]
+        for k, i in enumerate(shown):
+            mn, avg, mx, p95 = (quantize(v, step) for v in self.stats(i)) if step else self.stats(i)
+            branch = "└─" if k == len(shown) - 1 else "├─"
+            lines.append(f" {branch} {self.windows[i]}m: min {mn:{fmt}}{unit} avg {avg:{fmt}}{unit} "
+                         f"max {mx:{fmt}}{unit} p95 {p95:{fmt}}{unit}")
+        return lines
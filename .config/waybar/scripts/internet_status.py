@@ -1,14 +1,36 @@
 #!/usr/bin/python3
-import json
 import sys
+import math
+import bisect
 import socket
 import time
 import struct
 import signal
-from gi.repository import GLib
+import select
+import argparse
+import startup
+from collections import deque
+from emitter import Emitter
+from probes import PROBES, TcpProbe, parse_target, run_probes, selftest
 
-CHECK_INTERVAL = 5
+CHECK_INTERVAL = 5  # Per WAN target; the targets are spread over it instead of probed together
+ROUTER_INTERVAL = 2  # The router is cheap and first to notice a dropped link
+ROUTER_QUIET = 15  # The router's steady back-off; QUIET_INTERVAL / 4 targets, so it wakes with a WAN probe
+QUIET_INTERVAL = 60  # While online and nothing changes, each WAN target backs off up to this
+BACKOFF_CAP = 30  # A target that keeps failing backs off exponentially up to this
 TIMEOUT = 1.0
+NETLINK_SETTLE = 0.5  # Let a burst of link/route messages finish before re-probing
+# RTMGRP_LINK | RTMGRP_IPV4_ROUTE | RTMGRP_IPV6_ROUTE; address changes that matter also move a route
+NETLINK_GROUPS = 0x1 | 0x40 | 0x400
+RTM_NEWLINK, RTM_DELLINK, RTM_NEWROUTE, RTM_DELROUTE = 16, 17, 24, 25
+RTA_OIF, RTA_GATEWAY, RTA_TABLE = 4, 5, 15
+RT_TABLE_MAIN = 254
+RTN_UNICAST = 1
+LINK_FLAGS = 0x1 | 0x40 | 0x10000  # IFF_UP | IFF_RUNNING | IFF_LOWER_UP
+RTT_WINDOW = 20  # Probes per target kept for median/p95/loss
+DEGRADED_LOSS = 20  # Reachable but degraded past this loss %
+DEGRADED_P95 = 300  # ms
+DEGRADED_JITTER = 50  # ms
 PRIMARY_COLOR = "#48A3FF"
 WARNING_COLOR = "#ff9a3c"
 CRITICAL_COLOR = "#dc2f2f"
@@ -17,12 +39,243 @@ ICON_ONLINE = "󰲝"
 ICON_LOCAL = "󰌚"
 ICON_OFFLINE = "󰲜"
 
-class NetMonitor:
+# NAME:PROBE:HOST[:PORT][/PATH]; an http target that fails (e.g. a captive portal) keeps the state from "online"
+DEFAULT_TARGETS = ["Quad9:dns:9.9.9.9", "Google:dns:8.8.8.8", "Cloudflare:dns:1.1.1.1",
+                   "Portal:http:connectivitycheck.gstatic.com/generate_204"]
+
+class RttStats:
+    """The last RTT_WINDOW probe results of one target, None for a lost probe.
+
+    Successful RTTs are also kept sorted (bisect on insert and evict), so median and p95
+    are index lookups; the loss count and the RFC 3550 jitter estimate
+    (J += (|D| - J) / 16 over consecutive RTTs) are updated per sample.
+    """
+    def __init__(self, size=RTT_WINDOW):
+        self.ring = deque(maxlen=size)
+        self.sorted = []
+        self.lost = 0
+        self.jitter = 0.0
+        self.prev = None
+
+    def add(self, rtt):
+        if len(self.ring) == self.ring.maxlen:
+            old = self.ring[0]
+            if old is None: self.lost -= 1
+            else: del self.sorted[bisect.bisect_left(self.sorted, old)]
+        self.ring.append(rtt)
+        if rtt is None:
+            self.lost += 1
+            return
+        bisect.insort(self.sorted, rtt)
+        if self.prev is not None: self.jitter += (abs(rtt - self.prev) - self.jitter) / 16
+        self.prev = rtt
+
+    @property
+    def last(self):
+        return self.ring[-1] if self.ring else None
+
+    @property
+    def up(self):
+        """Reachable unless the last two probes were both lost; one drop alone only degrades."""
+        return any(rtt is not None for rtt in list(self.ring)[-2:])
+
+    @property
+    def loss(self):
+        return self.lost / len(self.ring) * 100 if self.ring else 0.0
+
+    def percentile(self, q):
+        if not self.sorted: return None
+        return self.sorted[min(len(self.sorted) - 1, int(q * len(self.sorted)))]
+
+    @property
+    def healthy(self):
+        p95 = self.percentile(0.95)
+        return (self.last is not None and self.loss < DEGRADED_LOSS and self.jitter < DEGRADED_JITTER
+                and p95 is not None and p95 < DEGRADED_P95)
+
+    def summary(self):
+        if not self.sorted: return "no replies"
+        return (f"med {self.percentile(0.5):.0f} p95 {self.percentile(0.95):.0f} "
+                f"jitter {self.jitter:.0f} loss {self.loss:.0f}%")
+
+class Slot:
+    """One target's place in the Schedule."""
+    def __init__(self, interval, phase, quiet):
+        self.interval, self.phase, self.quiet = interval, phase, quiet
+        self.delay = interval
+        self.due = time.monotonic()
+        self.ok = None
+
+class Schedule:
+    """When each target is probed next.
+
+    Everything is probed once at start; after that each target is due on its own grid,
+    start + (k + phase) * delay, so targets sharing a delay stay spread over it however
+    far they have backed off. A target that keeps failing backs off exponentially up to
+    BACKOFF_CAP and stops costing a TIMEOUT every cycle; one that keeps answering while
+    online backs off up to its quiet interval. A result that flips re-probes the targets
+    that still say otherwise right away and puts them back on their base interval
+    (hurry), so the state leaves "online" within QUIET_INTERVAL / n of the first failure
+    of n WAN targets.
+    """
+    def __init__(self):
+        self.slots = {}
+        self.start = time.monotonic()
+
+    def add(self, name, interval, phase=0.0, quiet=None):
+        self.slots[name] = Slot(interval, phase, quiet or interval)
+
+    def due(self):
+        now = time.monotonic()
+        return {name for name, slot in self.slots.items() if slot.due <= now}
+
+    def next_due(self):
+        return min(slot.due for slot in self.slots.values())
+
+    def hurry(self, ok=None):
+        """Re-probe now every target whose last result isn't ok (None: all); done() puts them back on their grid."""
+        now = time.monotonic()
+        for slot in self.slots.values():
+            if ok is not None and slot.ok in (ok, None): continue
+            slot.delay = slot.interval
+            slot.due = min(slot.due, now)
+
+    def done(self, name, ok, steady=False):
+        """Record a probe result; steady: the state was online before and after it."""
+        slot = self.slots[name]
+        first, flipped = slot.ok is None, slot.ok is not None and ok != slot.ok
+        if first or flipped: slot.delay = slot.interval
+        elif not ok: slot.delay = min(slot.delay * 2, BACKOFF_CAP)
+        else: slot.delay = min(slot.delay * 2, slot.quiet) if steady else slot.interval
+        slot.ok = ok
+        # The next point of the slot's grid at least half a delay away
+        k = math.ceil((time.monotonic() + slot.delay / 2 - self.start) / slot.delay - slot.phase)
+        slot.due = self.start + (k + slot.phase) * slot.delay
+        if flipped: self.hurry(ok)
+
+def open_netlink():
+    """A non-blocking rtnetlink socket subscribed to link, address and route changes, or None."""
+    try:
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, socket.NETLINK_ROUTE)
+        sock.bind((0, NETLINK_GROUPS))
+        sock.setblocking(False)
+        return sock
+    except (OSError, AttributeError): return None
+
+def drain(sock):
+    """Every pending datagram; None marks an overflow (ENOBUFS), after which nothing is known."""
+    datagrams = []
+    while True:
+        try: datagrams.append(sock.recv(65536))
+        except BlockingIOError: return datagrams
+        except OSError: datagrams.append(None)  # ENOBUFS: the kernel dropped messages during a burst
+
+def netlink_messages(data):
+    """(nlmsg_type, payload) for each message in a datagram."""
+    offset = 0
+    while offset + 16 <= len(data):
+        length, kind = struct.unpack_from("=IH", data, offset)
+        if length < 16: break
+        yield kind, data[offset + 16:offset + length]
+        offset += (length + 3) & ~3
+
+def rtattrs(payload, offset):
+    attrs = {}
+    while offset + 4 <= len(payload):
+        length, kind = struct.unpack_from("=HH", payload, offset)
+        if length < 4: break
+        attrs[kind] = payload[offset + 4:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+def gateway(raw):
+    return raw if raw and any(raw) else None
+
+class RouteWatch:
+    """Boils rtnetlink traffic down to the changes that can move reachability.
+
+    Those are a change to the set of main-table default routes, keyed by (family, oif,
+    gateway), or to the up/running/carrier flags of an interface one of them goes
+    through. veth/docker churn on other interfaces, wireless scan events (a NEWLINK with
+    unchanged flags) and IPv6 RA lifetime refreshes (a NEWROUTE for a route already
+    known) are ignored. The set starts from /proc/net/route and /proc/net/ipv6_route.
+    """
     def __init__(self):
-        self.targets = [("Quad9", "9.9.9.9", 53), ("Google", "8.8.8.8", 53), ("Cloudflare", "1.1.1.1", 53)]
-        self.router = self.get_default_gateway()
-        self.check_connectivity()
-        GLib.timeout_add_seconds(CHECK_INTERVAL, self.timer_tick)
+        self.links = {}
+        self.defaults = self.read_defaults()
+
+    @staticmethod
+    def read_defaults():
+        defaults = set()
+        try:
+            with open("/proc/net/route") as f:
+                for line in list(f)[1:]:
+                    fields = line.split()
+                    if len(fields) < 8 or fields[1] != '00000000' or fields[7] != '00000000': continue
+                    gw = struct.pack("<L", int(fields[2], 16))
+                    defaults.add((socket.AF_INET, socket.if_nametoindex(fields[0]), gateway(gw)))
+        except (OSError, ValueError): pass
+        try:
+            with open("/proc/net/ipv6_route") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 10 or fields[9] == 'lo' or fields[1] != '00' or any(c != '0' for c in fields[0]): continue
+                    defaults.add((socket.AF_INET6, socket.if_nametoindex(fields[9]), gateway(bytes.fromhex(fields[4]))))
+        except (OSError, ValueError): pass
+        return defaults
+
+    def route(self, kind, payload):
+        if len(payload) < 12: return False
+        family, dst_len, _, _, table, _, _, rtype = struct.unpack_from("=8B", payload)
+        attrs = rtattrs(payload, 12)
+        if RTA_TABLE in attrs: table = struct.unpack("=I", attrs[RTA_TABLE][:4])[0]
+        if dst_len or table != RT_TABLE_MAIN or rtype != RTN_UNICAST: return False
+        oif = struct.unpack("=i", attrs[RTA_OIF][:4])[0] if RTA_OIF in attrs else 0
+        key = (family, oif, gateway(attrs.get(RTA_GATEWAY)))
+        known = key in self.defaults
+        if kind == RTM_NEWROUTE: self.defaults.add(key)
+        else: self.defaults.discard(key)
+        return known != (kind == RTM_NEWROUTE)
+
+    def link(self, kind, payload):
+        if len(payload) < 16: return False
+        _, _, _, index, flags = struct.unpack_from("=BBHiI", payload)
+        flags = -1 if kind == RTM_DELLINK else flags & LINK_FLAGS
+        known = self.links.get(index)
+        self.links[index] = flags
+        if index not in {oif for _, oif, _ in self.defaults}: return False
+        # First news of the interface: only a link that isn't fully up is worth a probe
+        return flags != known if known is not None else flags != LINK_FLAGS
+
+    def feed(self, datagrams):
+        """True if any of the datagrams changed the default routes or their links."""
+        changed = False
+        for data in datagrams:
+            if data is None:
+                # Messages were lost: start over from /proc and assume the worst
+                self.links, self.defaults = {}, self.read_defaults()
+                changed = True
+                continue
+            for kind, payload in netlink_messages(data):
+                if kind in (RTM_NEWROUTE, RTM_DELROUTE): changed |= self.route(kind, payload)
+                elif kind in (RTM_NEWLINK, RTM_DELLINK): changed |= self.link(kind, payload)
+        return changed
+
+class NetMonitor:
+    def __init__(self, targets=DEFAULT_TARGETS):
+        self.targets = dict(parse_target(spec) for spec in targets)
+        self.router = None
+        self.router_probes = {}
+        self.emitter = Emitter()
+        self.state = None
+        self.stats = {name: RttStats() for name in self.targets}
+        self.stats["Router"] = RttStats()
+        self.schedule = Schedule()
+        # Round-robin while quiet: one of n WAN targets is due every QUIET_INTERVAL / n
+        for i, name in enumerate(self.targets):
+            self.schedule.add(name, CHECK_INTERVAL, i / len(self.targets), QUIET_INTERVAL)
+        self.schedule.add("Router", ROUTER_INTERVAL, quiet=ROUTER_QUIET)
+        self.routes = RouteWatch()
 
     def get_default_gateway(self):
         try:
@@ -33,47 +286,84 @@ class NetMonitor:
                     return socket.inet_ntoa(struct.pack("<L", int(fields[2], 16)))
         except: return "192.168.1.1"
 
-    def check_tcp(self, ip, port):
-        try:
-            start = time.time()
-            with socket.create_connection((ip, port), timeout=TIMEOUT):
-                return (time.time() - start) * 1000
-        except: return None
-
-    def timer_tick(self):
-        self.check_connectivity()
-        return True
-
-    def check_connectivity(self):
-        results = {}
-        internet_ok = False
-        for name, ip, port in self.targets:
-            ping = self.check_tcp(ip, port)
-            results[name] = ping
-            if ping is not None: internet_ok = True
-
-        router_ping = self.check_tcp(self.router, 53) or self.check_tcp(self.router, 80)
-        results["Router"] = router_ping
-
-        if internet_ok: self.update_ui("online", results)
-        elif router_ping: self.update_ui("local", results)
-        else: self.update_ui("offline", results)
-
-    def update_ui(self, state, data):
+    def wait(self, netlink, timeout):
+        """Sleep up to timeout; True if a default route or its link changed meanwhile."""
+        deadline = time.monotonic() + max(0.0, timeout)
+        if netlink is None:
+            time.sleep(max(0.0, timeout))
+            return False
+        while (remaining := deadline - time.monotonic()) > 0:
+            if not select.select([netlink], [], [], remaining)[0]: return False
+            if self.routes.feed(drain(netlink)):
+                time.sleep(NETLINK_SETTLE)
+                self.routes.feed(drain(netlink))
+                return True
+        return False
+
+    def run(self):
+        # A plain loop: a GLib main loop cost a gi import for a single timer
+        netlink = open_netlink()
+        while True:
+            self.check_connectivity(self.schedule.due())
+            if self.wait(netlink, self.schedule.next_due() - time.monotonic()): self.schedule.hurry()
+
+    def check_connectivity(self, due=None):
+        """Probe the due targets (all by default) and re-classify from every target's stats."""
+        if due is None: due = set(self.schedule.slots)
+        probes = {name: probe for name, probe in self.targets.items() if name in due}
+        if "Router" in due:
+            router = self.get_default_gateway()
+            if router != self.router:
+                # The router answers on DNS or on its web UI; either port counts
+                self.router_probes = {port: TcpProbe(router, port) for port in (53, 80)}
+                self.stats["Router"] = RttStats()
+            self.router = router
+            probes["Router"] = self.router_probes[53]
+        pings = run_probes(probes, TIMEOUT)
+        # Port 80 only if DNS didn't answer: one connection per router probe in the common case
+        if "Router" in due and pings["Router"] is None:
+            pings["Router"] = run_probes({"Router": self.router_probes[80]}, TIMEOUT)["Router"]
+
+        results = {name: pings[name] for name in [*self.targets, "Router"] if name in due}
+        for name, ms in results.items(): self.stats[name].add(ms)
+
+        wan = [(probe, self.stats[name]) for name, probe in self.targets.items()]
+        if any(st.up for _, st in wan):
+            gated = all(st.up for probe, st in wan if probe.gates)
+            state = "online" if gated and any(st.healthy for _, st in wan) else "degraded"
+        else: state = "local" if self.stats["Router"].up else "offline"
+        steady = state == self.state == "online"
+        self.state = state
+        for name, ms in results.items(): self.schedule.done(name, ms is not None, steady)
+        self.update_ui(state)
+        return state
+
+    def update_ui(self, state):
         tooltip = f"<span color='{PRIMARY_COLOR}'>Network Status:</span>\n"
-        if state == "online": text = f"<span color='{SUCCESS_COLOR}'>{ICON_ONLINE}</span>"; css = "online"
-        elif state == "local": text = f"<span color='{WARNING_COLOR}'>{ICON_LOCAL}</span>"; css = "local"
-        else: text = f"<span color='{CRITICAL_COLOR}'>{ICON_OFFLINE}</span>"; css = "offline"
+        if state == "online": text = f"<span color='{SUCCESS_COLOR}'>{ICON_ONLINE}</span>"
+        elif state == "degraded": text = f"<span color='{WARNING_COLOR}'>{ICON_ONLINE}</span>"
+        elif state == "local": text = f"<span color='{WARNING_COLOR}'>{ICON_LOCAL}</span>"
+        else: text = f"<span color='{CRITICAL_COLOR}'>{ICON_OFFLINE}</span>"
 
-        for host, ms in data.items():
-            status = f"{int(ms)}ms" if ms else "Unreachable"
-            color = SUCCESS_COLOR if ms else CRITICAL_COLOR
-            tooltip += f" ├─ {host}: <span color='{color}'>{status}</span>\n"
+        for i, (host, st) in enumerate(self.stats.items()):
+            ms = st.last
+            status = f"{ms:.0f}ms" if ms is not None else "Unreachable"
+            color = CRITICAL_COLOR if ms is None else SUCCESS_COLOR if st.healthy else WARNING_COLOR
+            branch = "└─" if i == len(self.stats) - 1 else "├─"
+            kind = self.targets[host].kind if host in self.targets else "tcp"
+            tooltip += f" {branch} {host} ({kind}): <span color='{color}'>{status}</span> ({st.summary()})\n"
 
-        print(json.dumps({"text": text, "tooltip": tooltip.strip(), "class": css}), flush=True)
+        self.emitter.emit({"text": text, "tooltip": tooltip.strip(), "class": state})
 
 if __name__ == "__main__":
+    startup.install()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--target', action='append', metavar='NAME:PROBE:HOST[:PORT][/PATH]',
+                        help=f"Probe this instead of the defaults; repeatable. Probes: {', '.join(PROBES)}")
+    parser.add_argument('--selftest', action='store_true', help='Run every probe against local stand-in servers and exit')
+    args = parser.parse_args()
+    if args.selftest: sys.exit(0 if selftest() else 1)
+    try: monitor = NetMonitor(args.target or DEFAULT_TARGETS)
+    except ValueError as e: parser.error(f"--target: {e}")
     signal.signal(signal.SIGINT, signal.SIG_DFL)
-    app = NetMonitor()
-    loop = GLib.MainLoop()
-    loop.run()
\ No newline at end of file
+    monitor.run()
\ No newline at end of file
@@ -1,9 +1,10 @@
 #!/usr/bin/python3
 import gi
-import json
 import sys
 import html
 import signal
+import startup
+from emitter import Emitter
 
 gi.require_version('Playerctl', '2.0')
 from gi.repository import Playerctl, GLib
@@ -12,6 +13,7 @@ from gi.repository import Playerctl, GLib
 SCROLL_LENGTH = 20
 PRIMARY_COLOR = "#48A3FF"
 STARTUP_DELAY_MS = 750 
+RETRY_MS = 1000  # After a failed update, try again this much later instead of blanking the module
 
 ICONS = {
     "Default": "󰝛",
@@ -42,9 +44,12 @@ class WaybarPlayer:
         self.manager.connect('player-vanished', self.on_player_vanished)
         
         self.current_player = None
+        self.emitter = Emitter()
         self.scroll_index = 0
         self.scroll_timer = None
         self.position_timer = None
+        self.retry_timer = None
+        self.failing = False
         
         GLib.timeout_add(STARTUP_DELAY_MS, self.initial_check)
 
@@ -60,7 +65,7 @@ class WaybarPlayer:
                 if not found:
                     self.init_player(self.manager.props.player_names[0])
             else:
-                self.exit_cleanly()
+                self.show_stopped()
         return False
 
     def init_player(self, name):
@@ -88,7 +93,7 @@ class WaybarPlayer:
                 self.current_player = self.manager.props.players[0]
                 self.update_output()
             else:
-                self.exit_cleanly()
+                self.show_stopped()
 
     def on_state_change(self, player, status):
         if player == self.current_player:
@@ -98,11 +103,15 @@ class WaybarPlayer:
         if player == self.current_player:
             self.update_output()
 
-    def exit_cleanly(self):
-        print(json.dumps({"text": "", "tooltip": "", "class": "stopped"}), flush=True)
+    def show_stopped(self):
+        # Stay resident and wait for name-appeared: exiting would make Waybar pay the GI import again
+        self.current_player = None
+        self.emitter.emit({"text": "", "tooltip": "", "class": "stopped"})
         if self.scroll_timer: GLib.source_remove(self.scroll_timer)
         if self.position_timer: GLib.source_remove(self.position_timer)
-        sys.exit(0)
+        if self.retry_timer: GLib.source_remove(self.retry_timer)
+        self.scroll_timer = self.position_timer = self.retry_timer = None
+        self.scroll_index = 0
 
     def format_time(self, microseconds):
         try:
@@ -201,14 +210,31 @@ class WaybarPlayer:
             tooltip += f" ├─ Loop: {loop_txt}\n"
             tooltip += f" └─ Shuffle: {shuffle_txt}"
 
-            print(json.dumps({
+            self.emitter.emit({
                 "text": output_text,
                 "tooltip": tooltip,
                 "class": status.value_nick.lower()
-            }), flush=True)
+            })
+            self.failing = False
 
-        except Exception:
-            self.exit_cleanly()
+        except Exception as e:
+            self.on_error(e)
+
+    def on_error(self, error):
+        # A transient D-Bus error keeps the last payload and retries; only a player that is
+        # really gone is replaced by another managed one, or by the stopped payload
+        if not self.failing: sys.stderr.write(f"player.py: update failed: {error}\n")
+        self.failing = True
+        players = list(self.manager.props.players)
+        if self.current_player not in players:
+            if not players: return self.show_stopped()
+            self.current_player = players[0]
+        if not self.retry_timer: self.retry_timer = GLib.timeout_add(RETRY_MS, self.on_retry)
+
+    def on_retry(self):
+        self.retry_timer = None
+        self.update_output()
+        return False
 
     def on_tick_scroll(self):
         self.scroll_index += 1
@@ -220,6 +246,7 @@ class WaybarPlayer:
         return True
 
 if __name__ == '__main__':
+    startup.install()
     signal.signal(signal.SIGINT, signal.SIG_DFL)
     app = WaybarPlayer()
     loop = GLib.MainLoop()
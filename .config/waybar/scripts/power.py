@@ -2,15 +2,23 @@
 import json
 import glob
 import os
+import sys
+import time
+import argparse
+import startup
+from sysfs import SysfsAttr
+from emitter import Emitter
 
 PRIMARY_COLOR = "#48A3FF"
 WARNING_COLOR = "#ff9a3c"
 CRITICAL_COLOR = "#dc2f2f"
+UPDATE_INTERVAL = 2
+OTHER_ESTIMATE_W = 40 + 25 + 45  # Board, drives and fans: not measured, a fixed guess
 
-def get_val(path):
-    try:
-        with open(path, 'r') as f: return int(f.read().strip()) / 1000000.0
-    except: return 0.0
+def get_val(attr):
+    if not attr: return 0.0
+    micro = attr.read_int(None)
+    return None if micro is None else micro / 1000000.0
 
 def scan_sensors():
     paths = {}
@@ -23,25 +31,135 @@ def scan_sensors():
                 if os.path.exists(f"{hwmon}/power1_average"): paths['gpu'] = f"{hwmon}/power1_average"
                 elif os.path.exists(f"{hwmon}/power1_input"): paths['gpu'] = f"{hwmon}/power1_input"
         except: continue
-    return paths
-
-def main():
-    paths = scan_sensors()
-    cpu_w = get_val(paths.get('cpu', ''))
-    gpu_w = get_val(paths.get('gpu', ''))
-    other_w = 40 + 25 + 45 
-    total_w = cpu_w + gpu_w + other_w
+    return {key: SysfsAttr(path) for key, path in paths.items()}
+
+def read_text(path):
+    try:
+        with open(path, 'r') as f: return f.read().strip()
+    except OSError: return None
+
+class EnergyCounter:
+    """A cumulative µJ counter turned into average watts over the time between two reads."""
+    def __init__(self, name, path, max_range=0):
+        self.name = name
+        self.attr = SysfsAttr(path, 32)
+        self.max_range = max_range
+        self.prev = None
+        self.prev_time = 0.0
+
+    def sample(self):
+        """Watts since the previous read; None on the first read, False if the counter can't be read."""
+        value = self.attr.read_int(None)
+        now = time.monotonic()
+        if value is None: return False
+        watts = None
+        if self.prev is not None and now > self.prev_time:
+            delta = value - self.prev
+            # RAPL counters wrap at max_energy_range_uj; hwmon ones have no known range
+            if delta < 0 and self.max_range: delta += self.max_range
+            if delta >= 0: watts = delta / 1000000.0 / (now - self.prev_time)
+        self.prev, self.prev_time = value, now
+        return watts
+
+def scan_energy():
+    counters = []
+    for zone in sorted(glob.glob("/sys/class/powercap/intel-rapl:*")):
+        name = read_text(f"{zone}/name") or os.path.basename(zone)
+        try: max_range = int(read_text(f"{zone}/max_energy_range_uj") or 0)
+        except ValueError: max_range = 0
+        counters.append(EnergyCounter(name, f"{zone}/energy_uj", max_range))
+    for path in sorted(glob.glob("/sys/class/hwmon/hwmon*/energy*_input")):
+        hwmon = os.path.dirname(path)
+        label = read_text(path.replace("_input", "_label")) or read_text(f"{hwmon}/name") or os.path.basename(path)
+        counters.append(EnergyCounter(label, path))
+    # energy_uj is root-only on most kernels; unreadable zones fall back to power1_input
+    return [c for c in counters if c.attr.available]
+
+def read_energy(counters):
+    """Average watts per domain since the last call; None if a counter failed and the scan is stale."""
+    domains = {}
+    for counter in counters:
+        watts = counter.sample()
+        if watts is False: return None
+        if watts is not None: domains[counter.name] = domains.get(counter.name, 0.0) + watts
+    return domains
+
+def package_watts(domains):
+    packages = [w for name, w in domains.items() if name.startswith('package') or name.startswith('Esocket')]
+    return sum(packages) if packages else None
+
+def read_power(paths):
+    """Read every cached sensor; None if one of them failed and the hwmon scan is stale."""
+    values = {key: get_val(paths.get(key)) for key in ('cpu', 'gpu')}
+    if None in values.values(): return None
+    return values
+
+def render(cpu_w, gpu_w, domains=None):
+    total_w = cpu_w + gpu_w + OTHER_ESTIMATE_W
     
-    if total_w > 320: text = f"<span color='{CRITICAL_COLOR}'> {total_w:.0f}W</span>"; css = "critical"
-    elif total_w > 200: text = f"<span color='{WARNING_COLOR}'> {total_w:.0f}W</span>"; css = "warning"
-    else: text = f" {total_w:.0f}W"; css = "normal"
+    if total_w > 320: text = f"<span color='{CRITICAL_COLOR}'> {total_w:.0f}W</span>"; css = "critical"
+    elif total_w > 200: text = f"<span color='{WARNING_COLOR}'> {total_w:.0f}W</span>"; css = "warning"
+    else: text = f" {total_w:.0f}W"; css = "normal"
 
     tooltip = f"<span color='{PRIMARY_COLOR}'>Power Usage:</span>\n"
     tooltip += f" ├─ CPU: {cpu_w:.1f}W\n"
+    for name, watts in (domains or {}).items():
+        tooltip += f" │   ├─ {name}: {watts:.1f}W\n"
     tooltip += f" ├─ GPU: {gpu_w:.1f}W\n"
     tooltip += f" └─ Total: {total_w:.1f}W (est)"
 
-    print(json.dumps({"text": text, "tooltip": tooltip, "class": css}))
+    return {"text": text, "tooltip": tooltip, "class": css}
+
+class PowerSampler:
+    """Cached hwmon/RAPL scan; in energy mode CPU watts are averaged from the energy counters."""
+    def __init__(self, energy):
+        self.energy = energy
+        self.paths = {}
+        self.counters = []
+        self.rescan()
+
+    def rescan(self):
+        for attr in self.paths.values(): attr.close()
+        for counter in self.counters: counter.attr.close()
+        self.paths = scan_sensors()
+        self.counters = scan_energy() if self.energy else []
+
+    def sample(self):
+        values = read_power(self.paths)
+        domains = read_energy(self.counters)
+        if values is None or domains is None:
+            self.rescan()
+            values = read_power(self.paths) or {'cpu': 0.0, 'gpu': 0.0}
+            domains = read_energy(self.counters) or {}
+        cpu_w = package_watts(domains)
+        if cpu_w is not None: values['cpu'] = cpu_w
+        return render(values['cpu'], values['gpu'], domains)
+
+def main(energy, interval):
+    sampler = PowerSampler(energy)
+    # Energy counters need two reads to give an average over the interval
+    if sampler.counters:
+        sampler.sample()
+        time.sleep(interval)
+    print(json.dumps(sampler.sample()))
+
+def daemon(energy, interval):
+    # Keep the scans and the open sensor fds; rescan only when a read fails
+    sampler = PowerSampler(energy)
+    emitter = Emitter()
+    while True:
+        emitter.emit(sampler.sample())
+        time.sleep(interval)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    startup.install()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--daemon', action='store_true', help='Keep running and print a JSON line every interval')
+    parser.add_argument('--interval', type=float, default=UPDATE_INTERVAL, help='Seconds between samples in daemon mode')
+    parser.add_argument('--energy', action='store_true', help='Average CPU power from RAPL/hwmon energy counters')
+    args = parser.parse_args()
+    try:
+        if args.daemon: daemon(args.energy, args.interval)
+        else: main(args.energy, args.interval)
+    except KeyboardInterrupt:
+        sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,300 @@
+"""Connectivity probes for internet_status.py, run concurrently from one selector.
+
+A probe's run() is a generator: it yields (socket, selectors event) whenever it has to
+wait and returns True or False when it's done, so multi-phase probes (resolve, connect,
+request, read) interleave without threads. run_probes() drives a batch of them and
+bounds the whole batch by one timeout.
+"""
+import os
+import errno
+import socket
+import struct
+import time
+import selectors
+
+PROBES = {}
+RESOLV_CONF = "/etc/resolv.conf"
+DNS_NAME = "example.com"  # Asked by the dns probe; any name the resolver can answer
+HTTP_PATH = "/generate_204"
+
+def register(name):
+    def add(cls):
+        PROBES[name] = cls
+        cls.kind = name
+        return cls
+    return add
+
+def is_ip(host):
+    try:
+        socket.inet_aton(host)
+        return True
+    except (OSError, TypeError): return False
+
+def system_resolver():
+    try:
+        with open(RESOLV_CONF) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) > 1 and fields[0] == "nameserver" and is_ip(fields[1]): return fields[1]
+    except OSError: pass
+    return "127.0.0.53"
+
+def dns_query(name, qid):
+    """A recursive query for the A record of name."""
+    header = struct.pack("!HHHHHH", qid, 0x0100, 1, 0, 0, 0)
+    qname = b"".join(bytes([len(label)]) + label.encode() for label in name.strip('.').split('.')) + b"\0"
+    return header + qname + struct.pack("!HH", 1, 1)
+
+def skip_name(msg, offset):
+    while True:
+        length = msg[offset]
+        if length == 0: return offset + 1
+        if length & 0xC0 == 0xC0: return offset + 2
+        offset += length + 1
+
+def dns_answer(msg, qid):
+    """(rcode, first A record or None) for a reply to qid; None if it isn't one."""
+    if len(msg) < 12: return None
+    rid, flags, qdcount, ancount = struct.unpack_from("!HHHH", msg)
+    if rid != qid or not flags & 0x8000: return None
+    offset = 12
+    try:
+        for _ in range(qdcount): offset = skip_name(msg, offset) + 4
+        for _ in range(ancount):
+            offset = skip_name(msg, offset)
+            rtype, _, _, length = struct.unpack_from("!HHIH", msg, offset)
+            offset += 10
+            if rtype == 1 and length == 4: return flags & 0xF, socket.inet_ntoa(msg[offset:offset + 4])
+            offset += length
+    except (IndexError, struct.error): pass
+    return flags & 0xF, None
+
+def query(addr, name):
+    """Generator phase: one A query over UDP to addr; returns dns_answer()'s tuple, or None on error."""
+    qid = int.from_bytes(os.urandom(2), 'big')
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    try:
+        sock.connect(addr)
+        sock.send(dns_query(name, qid))
+        while True:
+            yield sock, selectors.EVENT_READ
+            answer = dns_answer(sock.recv(512), qid)
+            if answer: return answer
+    except OSError: return None  # ICMP port unreachable surfaces as ECONNREFUSED
+    finally: sock.close()
+
+def connect(addr):
+    """Generator phase: a non-blocking TCP connect; returns the socket or None."""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setblocking(False)
+    try:
+        if sock.connect_ex(addr) not in (0, errno.EINPROGRESS):
+            sock.close()
+            return None
+        yield sock, selectors.EVENT_WRITE
+        if sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) == 0: return sock
+    except (OSError, TypeError): pass
+    sock.close()
+    return None
+
+class Probe:
+    """One kind of check against host[:port]; instances live as long as their target."""
+    default_port = None
+    gates = False  # True: a failure alone keeps the state from "online"
+
+    def __init__(self, host, port=None, path=None):
+        self.host = host
+        self.port = port or self.default_port
+        self.path = path
+
+    def describe(self):
+        return f"{self.kind} {self.host}:{self.port}{self.path or ''}"
+
+    def close(self):
+        pass
+
+@register('tcp')
+class TcpProbe(Probe):
+    """The TCP handshake alone."""
+    default_port = 53
+
+    def run(self):
+        sock = yield from connect((self.host, self.port))
+        if sock: sock.close()
+        return sock is not None
+
+@register('dns')
+class DnsProbe(Probe):
+    """A real A query over UDP to the host as resolver; NOERROR with an answer passes."""
+    default_port = 53
+
+    def run(self):
+        answer = yield from query((self.host, self.port), self.path.strip('/') if self.path else DNS_NAME)
+        return answer is not None and answer[0] == 0 and answer[1] is not None
+
+@register('http')
+class HttpProbe(Probe):
+    """HEAD over a kept-alive HTTP/1.1 connection; only a 2xx passes, so a portal's redirect fails it.
+
+    A host name is resolved with a query to `resolver` (the system one by default) on
+    reconnect, not with getaddrinfo, which would block past the probe timeout when DNS is down.
+    """
+    default_port = 80
+    gates = True
+
+    def __init__(self, host, port=None, path=None):
+        super().__init__(host, port, path or HTTP_PATH)
+        self.resolver = None  # (ip, port); None = the first nameserver in resolv.conf
+        self.sock = None
+        self.connections = 0
+
+    def close(self):
+        if self.sock: self.sock.close()
+        self.sock = None
+
+    def resolve(self):
+        answer = yield from query(self.resolver or (system_resolver(), 53), self.host)
+        return answer[1] if answer and answer[0] == 0 else None
+
+    def request(self):
+        return (f"HEAD {self.path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                "User-Agent: waybar-internet-status\r\nConnection: keep-alive\r\n\r\n").encode()
+
+    def run(self):
+        done = False
+        try:
+            for _ in range(2):
+                reused = self.sock is not None
+                if not reused:
+                    addr = self.host if is_ip(self.host) else (yield from self.resolve())
+                    self.sock = addr and (yield from connect((addr, self.port)))
+                    if not self.sock: return False
+                    self.connections += 1
+                status = yield from self.exchange()
+                if status is not None:
+                    done = True
+                    return 200 <= status < 300
+                # The server closed the idle connection between ticks: reconnect once
+                self.close()
+                if not reused: return False
+            return False
+        finally:
+            if not done: self.close()
+
+    def exchange(self):
+        """Send HEAD and read the response head; the status code, or None if the connection is dead."""
+        try:
+            self.sock.send(self.request())
+            head = b""
+            while b"\r\n\r\n" not in head:
+                yield self.sock, selectors.EVENT_READ
+                chunk = self.sock.recv(4096)
+                if not chunk: return None
+                head += chunk
+            status_line = head.split(b"\r\n", 1)[0].split()
+            if head.lower().find(b"\nconnection: close") >= 0: self.close()
+            return int(status_line[1])
+        except (OSError, ValueError, IndexError): return None
+
+def parse_target(spec):
+    """NAME:PROBE:HOST[:PORT][/PATH] -> (name, probe); PATH is the HTTP path or the DNS name to ask."""
+    name, kind, rest = spec.split(':', 2)
+    if kind not in PROBES: raise ValueError(f"unknown probe '{kind}', expected one of {', '.join(PROBES)}")
+    host, slash, path = rest.partition('/')
+    host, _, port = host.partition(':')
+    return name, PROBES[kind](host, int(port) if port else None, slash + path if slash else None)
+
+def run_probes(probes, timeout):
+    """Drive every probe's generator in one selector: {key: ms or None}, bounded by timeout."""
+    results = {}
+    sel = selectors.DefaultSelector()
+
+    def step(key, gen, start, value=None):
+        try: sock, event = gen.send(value)
+        except StopIteration as done:
+            results[key] = (time.monotonic() - start) * 1000 if done.value else None
+            return
+        except OSError:
+            results[key] = None
+            return
+        sel.register(sock, event, (key, gen, start))
+
+    for key, probe in probes.items(): step(key, probe.run(), time.monotonic())
+    deadline = time.monotonic() + timeout
+    while sel.get_map() and (remaining := deadline - time.monotonic()) > 0:
+        for k, _ in sel.select(remaining):
+            sel.unregister(k.fileobj)
+            step(*k.data)
+    for k in list(sel.get_map().values()):
+        results[k.data[0]] = None
+        k.data[1].close()  # GeneratorExit runs the probe's cleanup
+    sel.close()
+    return results
+
+def selftest():
+    """Run each probe against local stand-in servers, print the results; True if all behaved."""
+    import threading
+    dns = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    dns.bind(("127.0.0.1", 0))
+    http = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    http.bind(("127.0.0.1", 0))
+    http.listen(4)
+    closed = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    closed.bind(("127.0.0.1", 0))  # Bound but not listening: connects are refused
+    dns_port, http_port, closed_port = dns.getsockname()[1], http.getsockname()[1], closed.getsockname()[1]
+
+    def serve_dns():
+        while True:
+            query, peer = dns.recvfrom(512)
+            qend = skip_name(query, 12) + 4
+            # Answer every A question with 127.0.0.1 via a pointer to the question name
+            answer = struct.pack("!HHHIH", 0xC00C, 1, 1, 60, 4) + socket.inet_aton("127.0.0.1")
+            rcode = 3 if b"\x07missing" in query else 0
+            header = struct.pack("!HHHHHH", int.from_bytes(query[:2], 'big'), 0x8180 | rcode, 1, 0 if rcode else 1, 0, 0)
+            dns.sendto(header + query[12:qend] + (b"" if rcode else answer), peer)
+
+    def serve_http():
+        while True:
+            conn, _ = http.accept()
+            threading.Thread(target=serve_conn, args=(conn,), daemon=True).start()
+
+    def serve_conn(conn):
+        with conn:
+            head = b""
+            while (chunk := conn.recv(4096)):
+                head += chunk
+                while b"\r\n\r\n" in head:
+                    request, head = head.split(b"\r\n\r\n", 1)
+                    status = b"204 No Content" if request.split()[1] == b"/generate_204" else b"302 Found"
+                    conn.sendall(b"HTTP/1.1 " + status + b"\r\nContent-Length: 0\r\n\r\n")
+
+    for target in (serve_dns, serve_http): threading.Thread(target=target, daemon=True).start()
+
+    named = HttpProbe("portal.test", http_port)
+    named.resolver = ("127.0.0.1", dns_port)
+    cases = [
+        ("tcp open", TcpProbe("127.0.0.1", http_port), True),
+        ("tcp refused", TcpProbe("127.0.0.1", closed_port), False),
+        ("dns answer", DnsProbe("127.0.0.1", dns_port), True),
+        ("dns nxdomain", DnsProbe("127.0.0.1", dns_port, "/missing.test"), False),
+        ("dns refused", DnsProbe("127.0.0.1", closed_port), False),
+        ("http 204", HttpProbe("127.0.0.1", http_port), True),
+        ("http portal", HttpProbe("127.0.0.1", http_port, "/login"), False),
+        ("http by name", named, True),
+    ]
+    ok = True
+    # Two rounds: the second has to reuse the kept-alive HTTP connections
+    for round_ in (1, 2):
+        results = run_probes({label: probe for label, probe, _ in cases}, 1.0)
+        for label, probe, expected in cases:
+            passed = results[label] is not None
+            ok &= passed == expected
+            rtt = f"{results[label]:.1f}ms" if passed else ""
+            print(f"{'ok ' if passed == expected else 'BAD'} {round_} {label:13} {probe.describe():32} {'pass' if passed else 'fail'} {rtt}")
+    for label, probe, _ in cases:
+        if isinstance(probe, HttpProbe) and probe.connections > 1:
+            ok = False
+            print(f"BAD {label}: keep-alive not reused ({probe.connections} connections)")
+        probe.close()
+    return ok
@@ -0,0 +1,160 @@
+"""Unix-socket fan-out shared by the waybar monitors: one sampling daemon, many module clients."""
+import os
+import sys
+import time
+import fcntl
+import select
+import socket
+
+SERVE_IDLE_EXIT = 30  # A server with no subscribers exits after this many seconds
+
+def connect(path):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return sock
+    except OSError:
+        sock.close()
+        return None
+
+def spawn(argv):
+    import subprocess
+    subprocess.Popen(argv, start_new_session=True,
+                     stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+def send(path, message):
+    """Deliver a one-line message to a running server; False if none is listening."""
+    sock = connect(path)
+    if sock is None: return False
+    with sock: sock.sendall(message.encode() + b"\n")
+    return True
+
+def subscribe(path, topic, argv):
+    """Print the server's lines for one topic, spawning it with argv if needed. False if it can't be reached."""
+    sock = connect(path)
+    if sock is None:
+        spawn(argv)
+        for _ in range(40):
+            time.sleep(0.05)
+            if (sock := connect(path)): break
+        else: return False
+    with sock:
+        sock.sendall(topic.encode() + b"\n")
+        for line in sock.makefile('r'):
+            sys.stdout.write(line)
+            sys.stdout.flush()
+    return True
+
+class Broker:
+    """Server side: accepts subscribers and writes each one the changed lines of its topic.
+
+    A client sends one line naming its topic and then only reads; any other line goes to
+    on_message and the connection is closed. `current(topic)` supplies the first line for
+    a topic nobody has published yet. Everything is multiplexed with poll(), so the caller
+    can watch() other fds too, e.g. sysfs attributes for POLLPRI.
+    """
+    def __init__(self, path, topics, current, on_message=None, idle_exit=SERVE_IDLE_EXIT):
+        from emitter import Emitter  # Only the server needs it; clients skip the json import
+        self.emitter_class = Emitter
+        self.path = path
+        self.topic_names = topics
+        self.current = current
+        self.on_message = on_message
+        self.idle_exit = idle_exit
+        self.poller = select.poll()
+        self.watches = {}
+        self.conns = {}
+        self.clients = {}
+        self.last = {}
+        self.emitters = {}
+        self.idle_since = time.monotonic()
+
+    def acquire(self):
+        """Take the lock and bind; False if another server already owns the socket."""
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.lock = open(self.path + ".lock", 'w')
+        try: fcntl.flock(self.lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError: return False
+        try: os.unlink(self.path)
+        except FileNotFoundError: pass
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.path)
+        self.sock.listen(8)
+        self.sock.setblocking(False)
+        self.watch(self.sock.fileno(), select.POLLIN, self.accept)
+        return True
+
+    def close(self):
+        try: os.unlink(self.path)
+        except OSError: pass
+
+    def watch(self, fd, mask, callback):
+        self.poller.register(fd, mask)
+        self.watches[fd] = callback
+
+    def unwatch(self, fd):
+        self.watches.pop(fd, None)
+        try: self.poller.unregister(fd)
+        except KeyError: pass
+
+    def accept(self, fd, events):
+        try: conn, _ = self.sock.accept()
+        except OSError: return
+        conn.setblocking(False)
+        self.conns[conn.fileno()] = conn
+        self.watch(conn.fileno(), select.POLLIN, self.receive)
+
+    def drop(self, fd):
+        self.unwatch(fd)
+        self.clients.pop(fd, None)
+        conn = self.conns.pop(fd, None)
+        if conn: conn.close()
+        if not self.clients: self.idle_since = time.monotonic()
+
+    def send(self, fd, line):
+        # Connections are non-blocking: a subscriber that can't take a whole line is dropped
+        # instead of stalling the server and every other module behind it
+        data = line.encode() + b"\n"
+        try: sent = self.conns[fd].send(data)
+        except OSError: sent = 0
+        if sent < len(data): self.drop(fd)
+
+    def receive(self, fd, events):
+        # Subscribers never write after their topic line, so anything more is a hangup
+        try: data = b"" if fd in self.clients else self.conns[fd].recv(64)
+        except OSError: data = b""
+        message = data.decode(errors='ignore').strip()
+        if message not in self.topic_names:
+            if message and self.on_message: self.on_message(message)
+            return self.drop(fd)
+        self.clients[fd] = message
+        if message not in self.last: self.last[message] = self.current(message)
+        # Seed the topic's Emitter, or the next publish() would broadcast this same line again
+        self.emitter(message).changed(self.last[message])
+        self.send(fd, self.last[message])
+
+    def topics(self):
+        return set(self.clients.values())
+
+    def emitter(self, topic):
+        if topic not in self.emitters:
+            self.emitters[topic] = self.emitter_class(lambda l, t=topic: self.broadcast(t, l))
+        return self.emitters[topic]
+
+    def publish(self, topic, line):
+        """Send line to the topic's subscribers if it changed (or the heartbeat is due)."""
+        self.last[topic] = line
+        self.emitter(topic).emit(line)
+
+    def broadcast(self, topic, line):
+        for fd, t in list(self.clients.items()):
+            if t == topic: self.send(fd, line)
+
+    def idle(self):
+        return not self.clients and time.monotonic() - self.idle_since > self.idle_exit
+
+    def wait(self, deadline, stop=None):
+        """Serve clients and watched fds until the deadline, or until stop() turns true."""
+        while not (stop and stop()) and (timeout := deadline - time.monotonic()) > 0:
+            for fd, events in self.poller.poll(timeout * 1000):
+                if fd in self.watches: self.watches[fd](fd, events)
@@ -0,0 +1,4 @@
+"""Where the waybar monitors keep their sockets, spools and flags; cheap enough for every client to import."""
+import os
+
+RUNTIME_DIR = os.environ.get("XDG_RUNTIME_DIR") or f"/tmp/waybar-{os.getuid()}"
@@ -0,0 +1,52 @@
+"""Adaptive sampling intervals aligned to a shared monotonic deadline."""
+import os
+import time
+from runtime import RUNTIME_DIR
+
+FAST_INTERVAL = 1
+IDLE_INTERVAL = 10
+LOCKED_INTERVAL = 30
+IDLE_AFTER = 15  # Calm samples before backing off to IDLE_INTERVAL
+
+LOCK_FLAG = os.path.join(RUNTIME_DIR, "waybar-locked")  # Created by hypridle's lock_cmd while hyprlock runs
+
+def session_locked():
+    return os.path.exists(LOCK_FLAG)
+
+class AdaptiveScheduler:
+    """Samples fast while a value moves or sits near its threshold, backs off when calm or locked.
+
+    Deadlines are multiples of the interval on CLOCK_MONOTONIC, which every process
+    shares. Each interval is a multiple of the shorter ones, so the monitors wake in the
+    same instant instead of drifting apart with sleep(interval).
+    """
+    def __init__(self, base, fast=FAST_INTERVAL, idle=IDLE_INTERVAL, locked=LOCKED_INTERVAL):
+        self.base, self.fast, self.idle, self.locked = base, fast, idle, locked
+        self.interval = base
+        self.calm = 0
+        self.prev = {}
+
+    def update(self, hot=False, **values):
+        """Pick the next interval. hot: near a warning threshold; values: name=(value, moving_step)."""
+        moving = False
+        for name, (value, step) in values.items():
+            prev = self.prev.get(name)
+            if prev is not None and abs(value - prev) >= step: moving = True
+            self.prev[name] = value
+
+        if session_locked():
+            self.interval = self.locked
+        elif hot or moving:
+            self.calm = 0
+            self.interval = self.fast
+        else:
+            self.calm += 1
+            self.interval = self.idle if self.calm >= IDLE_AFTER else self.base
+        return self.interval
+
+    def deadline(self):
+        now = time.monotonic()
+        return (now // self.interval + 1) * self.interval
+
+    def sleep(self):
+        time.sleep(max(0.0, self.deadline() - time.monotonic()))
@@ -0,0 +1,64 @@
+"""mmap-backed fixed-size spool so restarted monitors keep their history and delta baselines."""
+import fcntl
+import mmap
+import os
+import struct
+import time
+import zlib
+from runtime import RUNTIME_DIR
+
+MAGIC = b"WBSP"
+HEADER = struct.Struct("=4sIdd")  # magic, layout crc, written at (CLOCK_BOOTTIME), reserved
+
+def boottime():
+    return time.clock_gettime(time.CLOCK_BOOTTIME)
+
+class Spool:
+    """Named regions laid out back to back in $XDG_RUNTIME_DIR/waybar-<name>.spool.
+
+    The file is reused only if its layout matches, it was written during this boot and
+    it is younger than max_age; otherwise it starts zeroed. `age` is None for a fresh
+    spool. With persist=False, or if the file is locked by another monitor, the regions
+    live in anonymous memory instead.
+    """
+    def __init__(self, name, layout, persist=True, max_age=900):
+        self.offsets = {}
+        offset = HEADER.size
+        for key, nbytes in layout:
+            self.offsets[key] = (offset, nbytes)
+            offset += (nbytes + 7) & ~7
+        self.size = offset
+        self.crc = zlib.crc32(repr(layout).encode())
+        self.path = os.path.join(RUNTIME_DIR, f"waybar-{name}.spool")
+        self.map = (persist and self.open_file()) or mmap.mmap(-1, self.size)
+
+        magic, crc, written, _ = HEADER.unpack_from(self.map)
+        age = boottime() - written
+        self.age = age if magic == MAGIC and crc == self.crc and 0 <= age <= max_age else None
+        if self.age is None: self.map[:] = bytes(self.size)
+        self.view = memoryview(self.map)
+        self.touch()
+
+    def open_file(self):
+        try:
+            os.makedirs(RUNTIME_DIR, exist_ok=True)
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o600)
+        except OSError: return None
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if os.fstat(fd).st_size != self.size:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, self.size)
+            # The fd stays open for the lock; the mapping is kept for the process lifetime
+            self.fd = fd
+            return mmap.mmap(fd, self.size)
+        except OSError:
+            os.close(fd)
+            return None
+
+    def region(self, key):
+        offset, nbytes = self.offsets[key]
+        return self.view[offset:offset + nbytes]
+
+    def touch(self):
+        HEADER.pack_into(self.map, 0, MAGIC, self.crc, boottime(), 0.0)
@@ -0,0 +1,56 @@
+"""Time-to-first-output check for the waybar scripts.
+
+`--profile-startup` prints how long after exec the first line reached stdout;
+`--startup-budget MS` does the same and then exits, with status 1 if it took longer
+and 0 otherwise, so the long-running scripts can be checked one-shot (check_startup.py).
+Both are taken out of sys.argv by install() before the script parses its own flags.
+"""
+import os
+import sys
+import time
+
+def process_age():
+    """Seconds since exec, from the starttime field of /proc/self/stat (clock-tick resolution)."""
+    with open("/proc/self/stat", "rb") as f: fields = f.read().rsplit(b")", 1)[1].split()
+    return time.clock_gettime(time.CLOCK_BOOTTIME) - int(fields[19]) / os.sysconf("SC_CLK_TCK")
+
+class FirstOutput:
+    """Stands in for sys.stdout until the first line is flushed, reports, then steps aside."""
+    def __init__(self, stream, budget=None):
+        self.stream = stream
+        self.budget = budget
+        self.pending = False
+
+    def write(self, s):
+        if "\n" in s: self.pending = True
+        return self.stream.write(s)
+
+    def flush(self):
+        self.stream.flush()
+        if self.pending: self.report()
+
+    def report(self):
+        sys.stdout = self.stream
+        ms = process_age() * 1000
+        name = os.path.basename(sys.argv[0])
+        over = self.budget is not None and ms > self.budget
+        sys.stderr.write(f"{name}: first output after {ms:.0f} ms" + (f" (budget {self.budget:g} ms)" if over else "") + "\n")
+        sys.stderr.flush()
+        if self.budget is not None: os._exit(1 if over else 0)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def install(argv=sys.argv):
+    """Strip the startup flags from argv and wrap stdout if one of them was given."""
+    budget, profile = None, False
+    if "--profile-startup" in argv:
+        argv.remove("--profile-startup")
+        profile = True
+    if "--startup-budget" in argv:
+        i = argv.index("--startup-budget")
+        try: budget = float(argv[i + 1])
+        except (IndexError, ValueError):
+            sys.exit(f"{os.path.basename(argv[0])}: --startup-budget needs a number of milliseconds")
+        del argv[i:i + 2]
+    if profile or budget is not None: sys.stdout = FirstOutput(sys.stdout, budget)
@@ -0,0 +1,59 @@
+"""Persistent-fd readers for small sysfs/procfs attributes, shared by the waybar scripts."""
+import errno
+import os
+import time
+
+REOPEN_ERRNOS = {errno.ENODEV, errno.ENOENT, errno.ENXIO, errno.ESTALE, errno.EBADF}
+REOPEN_INTERVAL = 10
+
+class SysfsAttr:
+    """An attribute opened once and re-read with os.preadv into a preallocated buffer.
+
+    A vanished device (ENODEV/ENOENT after hotplug) closes the fd; the next read reopens
+    the path, retrying a missing file at most every REOPEN_INTERVAL seconds.
+    """
+    def __init__(self, path, size=64):
+        self.path = path
+        self.buf = bytearray(size)
+        self.fd = None
+        self.next_open = 0.0
+        self.open()
+
+    def open(self):
+        try: self.fd = os.open(self.path, os.O_RDONLY | os.O_CLOEXEC)
+        except OSError:
+            self.fd = None
+            self.next_open = time.monotonic() + REOPEN_INTERVAL
+        return self.fd is not None
+
+    def close(self):
+        if self.fd is not None:
+            try: os.close(self.fd)
+            except OSError: pass
+            self.fd = None
+
+    @property
+    def available(self):
+        return self.fd is not None
+
+    def read_into(self):
+        """Fill the buffer and return the byte count, or -1 if the attribute can't be read."""
+        if self.fd is None and (time.monotonic() < self.next_open or not self.open()): return -1
+        try: return os.preadv(self.fd, [self.buf], 0)
+        except OSError as e:
+            self.close()
+            if e.errno not in REOPEN_ERRNOS or not self.open(): return -1
+            try: return os.preadv(self.fd, [self.buf], 0)
+            except OSError:
+                self.close()
+                return -1
+
+    def read(self):
+        n = self.read_into()
+        return None if n < 0 else self.buf[:n].decode(errors='replace').strip()
+
+    def read_int(self, default=0):
+        n = self.read_into()
+        if n <= 0: return default
+        try: return int(self.buf[:n])
+        except ValueError: return default
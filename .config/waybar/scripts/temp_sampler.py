@@ -0,0 +1,279 @@
+"""Sampling side of temp.py: the hwmon sensor index, the per-module views and the shared server."""
+import os
+import glob
+import json
+import time
+import select
+from sysfs import SysfsAttr
+from history import MetricHistory
+from spool import Spool
+from emitter import Emitter, quantize
+from scheduler import AdaptiveScheduler
+from pubsub import Broker
+
+UPDATE_INTERVAL = 2
+PRIMARY_COLOR = "#48A3FF"
+WARNING_COLOR = "#ff9a3c"
+CRITICAL_COLOR = "#dc2f2f"
+NEUTRAL_COLOR = "#FFFFFF"
+TEMP_STEP = 0.5  # Quantize readings so sub-step jitter doesn't force a redraw
+NEAR_WARNING = 5  # Sample fast within this many °C of the warning threshold
+MOVING_STEP = 2  # Or when the reading moved at least this much since the last sample
+HISTORY_REFRESH = 30  # Seconds between rebuilds of the History section, which would otherwise change every sample
+EVENT_INTERVAL = 30  # Fallback poll with --events while calm; a notified *_alarm wakes it early
+CRIT_DEFAULT = 95.0  # For sensors without temp*_crit (k10temp)
+RESCAN_INTERVAL = 30  # At most one hwmon rescan this often, and only once a sensor's file is gone
+
+HWMON_ROOT = "/sys/class/hwmon"
+DEVICES = {  # Kind -> (title, hwmon driver names)
+    'cpu': ("CPU", ('k10temp', 'zenpower', 'coretemp', 'cpu_thermal')),
+    'gpu': ("GPU", ('amdgpu', 'radeon', 'nouveau', 'i915', 'xe')),
+    'nvme': ("NVMe", ('nvme', 'drivetemp')),
+    'other': ("Other", ()),
+}
+
+def read_text(path):
+    try:
+        with open(path, 'r') as f: return f.read().strip()
+    except OSError: return None
+
+def classify(name):
+    return next((kind for kind, (_, drivers) in DEVICES.items() if name in drivers), 'other')
+
+class Sensor:
+    """One temp*_input with its label, critical point and (with --events) alarm attributes, held open."""
+    def __init__(self, path, kind, label):
+        self.path = path
+        self.kind = kind
+        self.label = label
+        self.attr = SysfsAttr(path)
+        self.alarms = []
+        crit = read_text(path.replace("_input", "_crit"))
+        try: self.crit = int(crit) / 1000.0 if crit else CRIT_DEFAULT
+        except ValueError: self.crit = CRIT_DEFAULT
+
+    def find_alarms(self):
+        """The *_alarm attributes; drivers that see a limit crossed sysfs_notify() them."""
+        for path in sorted(glob.glob(self.path.replace("_input", "_*alarm"))):
+            alarm = SysfsAttr(path, 8)
+            # Reading the attribute is what arms the notification for the next poll()
+            if alarm.read_into() >= 0: self.alarms.append(alarm)
+
+    def close(self):
+        self.attr.close()
+        for alarm in self.alarms: alarm.close()
+
+    def read(self):
+        milli = self.attr.read_int(None)
+        return None if milli is None else milli / 1000.0
+
+    def active_alarms(self):
+        """Names of the raised alarms; reading them also re-arms the notification."""
+        names = []
+        for alarm in self.alarms:
+            if alarm.read_int() > 0:
+                kind = os.path.basename(alarm.path).split('_')[1:-1]
+                names.append(kind[0] if kind else "limit")
+        return names
+
+class SensorIndex:
+    """Every hwmon temperature sensor of the requested kinds, found and labelled once.
+
+    Chips are classified by their hwmon `name`; sensors are labelled from temp*_label
+    (Tctl, Tccd1, edge, junction, mem, Composite), prefixed with the chip when a kind has
+    several of them (two NVMe drives).
+    """
+    def __init__(self, kinds, alarms=False):
+        self.kinds = kinds
+        self.alarms = alarms
+        self.sensors = []
+        self.scanned = 0.0
+        self.scan()
+
+    def scan(self):
+        for sensor in self.sensors: sensor.close()
+        self.sensors = []
+        self.scanned = time.monotonic()
+        chips = {}
+        for hwmon in sorted(glob.glob(f"{HWMON_ROOT}/hwmon*"), key=lambda h: int(h.rsplit('hwmon', 1)[1] or 0)):
+            name = read_text(f"{hwmon}/name") or os.path.basename(hwmon)
+            kind = classify(name)
+            if kind in self.kinds: chips.setdefault(kind, []).append((hwmon, name))
+        for kind, found in chips.items():
+            for i, (hwmon, name) in enumerate(found):
+                inputs = glob.glob(f"{hwmon}/temp*_input")
+                for path in sorted(inputs, key=lambda p: int(os.path.basename(p)[4:-6] or 0)):
+                    label = read_text(path.replace("_input", "_label")) or os.path.basename(path)[:-6]
+                    if len(found) > 1: label = f"{name}{i} {label}"
+                    sensor = Sensor(path, kind, label)
+                    if self.alarms: sensor.find_alarms()
+                    self.sensors.append(sensor)
+
+    def alarm_fds(self):
+        return [alarm.fd for sensor in self.sensors for alarm in sensor.alarms if alarm.available]
+
+    def read_all(self):
+        """The readings of the sensors that answered, and whether one of them has vanished."""
+        readings, gone = [], False
+        for sensor in self.sensors:
+            temp = sensor.read()
+            if temp is None:
+                # EIO/ENODATA (a sleeping wifi card or drive) only drops this sensor for the tick
+                gone |= not os.path.exists(sensor.path)
+                continue
+            readings.append((sensor, quantize(temp, TEMP_STEP), sensor.active_alarms()))
+        return readings, gone
+
+    def sample(self):
+        """[(sensor, °C, raised alarms)] from one read of each attribute, rescanning if a sensor is gone."""
+        readings, gone = self.read_all()
+        if gone and time.monotonic() - self.scanned >= RESCAN_INTERVAL:
+            self.scan()
+            readings, _ = self.read_all()
+        return readings
+
+def temp_class(temp, crit):
+    if temp >= crit - 5: return "critical"
+    if temp >= crit - 15: return "high"
+    return "normal"
+
+CLASS_RANK = {"normal": 0, "high": 1, "critical": 2}
+CLASS_COLORS = {"normal": NEUTRAL_COLOR, "high": WARNING_COLOR, "critical": CRITICAL_COLOR}
+
+class TempView:
+    """One module's share of a sampling pass: the sensors of its kinds, their history and payload."""
+    def __init__(self, device_type, persist=True):
+        self.device_type = device_type
+        self.kinds = list(DEVICES) if device_type == 'all' else [device_type]
+        size = MetricHistory.storage_size(UPDATE_INTERVAL)
+        self.spool = Spool(f"temp-{device_type}", [('history', size)], persist)
+        self.history = MetricHistory(UPDATE_INTERVAL, lo=0.0, hi=120.0, bins=240, storage=self.spool.region('history'))
+        self.temp = None
+        self.hot = False
+        self.history_lines = []
+        self.history_time = None
+
+    def render(self, readings):
+        readings = [r for r in readings if r[0].kind in self.kinds]
+        if not readings:
+            self.temp = None
+            return {"text": "N/A", "class": "error"}
+
+        # The bar shows the hottest sensor, coloured by whichever sensor is closest to its limit
+        temp = max(t for _, t, _ in readings)
+        css = max((temp_class(t, s.crit) for s, t, _ in readings), key=CLASS_RANK.get)
+        self.hot = any(t >= s.crit - 15 - NEAR_WARNING for s, t, _ in readings)
+        alarms = [f"{s.label} {name}" for s, _, raised in readings for name in raised]
+        if alarms: css = "critical"
+        self.temp = temp
+        self.spool.touch()
+        self.history.record(temp)
+
+        icon = ""
+        text = f"<span color='{CLASS_COLORS[css]}'>{icon} {temp:.1f}°C</span>"
+        tooltip = ""
+        for kind in self.kinds:
+            group = [(s, t) for s, t, _ in readings if s.kind == kind]
+            if not group: continue
+            if tooltip: tooltip += "\n\n"
+            tooltip += f"<span color='{PRIMARY_COLOR}'>󰔏 {DEVICES[kind][0]} Temperature:</span>\n"
+            lines = [f"{s.label}: <span color='{CLASS_COLORS[temp_class(t, s.crit)]}'>{t:.1f}°C</span> (crit {s.crit:.0f}°C)"
+                     for s, t in group]
+            tooltip += "\n".join(f" {'└─' if i == len(lines) - 1 else '├─'} {line}" for i, line in enumerate(lines))
+        if alarms: tooltip += f"\n\n<span color='{CRITICAL_COLOR}'>Alarm: {', '.join(alarms)}</span>"
+        now = time.monotonic()
+        if self.history_time is None or now - self.history_time >= HISTORY_REFRESH:
+            self.history_lines = self.history.summary("°C", ".1f", TEMP_STEP)
+            self.history_time = now
+        history = self.history_lines
+        if history:
+            tooltip += f"\n\n<span color='{PRIMARY_COLOR}'>󰄨 History:</span>\n" + "\n".join(history)
+        return {"text": text, "tooltip": tooltip, "class": css}
+
+def make_scheduler(events):
+    if events: return AdaptiveScheduler(EVENT_INTERVAL, idle=EVENT_INTERVAL)
+    return AdaptiveScheduler(UPDATE_INTERVAL)
+
+def schedule(scheduler, views):
+    hot = any(view.hot for view in views)
+    return scheduler.update(hot, **{view.device_type: (view.temp, MOVING_STEP) for view in views if view.temp is not None})
+
+class TempMonitor:
+    """A single module sampling in its own process."""
+    def __init__(self, device_type, persist=True, events=False):
+        self.view = TempView(device_type, persist)
+        self.index = SensorIndex(self.view.kinds, events)
+        self.scheduler = make_scheduler(events)
+
+    def get_output(self):
+        return self.view.render(self.index.sample())
+
+    def wait(self):
+        """Sleep until the scheduler's deadline, or until an alarm attribute is notified."""
+        fds = self.index.alarm_fds()
+        if not fds: return self.scheduler.sleep()
+        poller = select.poll()
+        for fd in fds: poller.register(fd, select.POLLPRI | select.POLLERR)
+        poller.poll(max(0.0, self.scheduler.deadline() - time.monotonic()) * 1000)
+
+    def run(self):
+        emitter = Emitter()
+        while True:
+            emitter.emit(self.get_output())
+            schedule(self.scheduler, [self.view])
+            self.wait()
+
+class TempServer:
+    """Samples the sensors its subscribers show once per tick and publishes one payload per device."""
+    def __init__(self, socket_path, devices, persist=True, events=False):
+        self.persist = persist
+        self.index = SensorIndex([], events)
+        self.scheduler = make_scheduler(events)
+        self.views = {}
+        self.readings = None
+        self.alarm_fds = []
+        self.alarmed = False
+        self.broker = Broker(socket_path, devices, self.current)
+
+    def view(self, device):
+        if device not in self.views: self.views[device] = TempView(device, self.persist)
+        return self.views[device]
+
+    def follow(self, devices):
+        """Index only the kinds some subscriber shows, so e.g. acpitz can't touch the cpu module; True if that changed."""
+        kinds = [kind for kind in DEVICES if any(kind in self.view(d).kinds for d in devices)]
+        if kinds == self.index.kinds: return False
+        self.index.kinds = kinds
+        self.index.scan()
+        return True
+
+    def current(self, device):
+        if self.follow(self.broker.topics() | {device}) or self.readings is None: self.readings = self.index.sample()
+        return json.dumps(self.view(device).render(self.readings))
+
+    def on_alarm(self, fd, events):
+        self.alarmed = True
+
+    def watch_alarms(self):
+        # A rescan opens new fds, so the poll set follows the index
+        fds = self.index.alarm_fds()
+        if fds == self.alarm_fds: return
+        for fd in self.alarm_fds: self.broker.unwatch(fd)
+        for fd in fds: self.broker.watch(fd, select.POLLPRI | select.POLLERR, self.on_alarm)
+        self.alarm_fds = fds
+
+    def run(self):
+        if not self.broker.acquire(): return
+        try:
+            while True:
+                devices = self.broker.topics()
+                self.follow(devices)
+                self.readings = self.index.sample()
+                self.alarmed = False
+                for device in devices: self.broker.publish(device, json.dumps(self.view(device).render(self.readings)))
+                if self.broker.idle(): return
+
+                self.watch_alarms()
+                schedule(self.scheduler, [self.views[d] for d in devices])
+                self.broker.wait(self.scheduler.deadline(), lambda: self.alarmed)
+        finally: self.broker.close()
@@ -0,0 +1,922 @@
+"""Sampling side of usage.py: /proc and sysfs readers, the monitor and the shared server."""
+import json
+import os
+import time
+import re
+import glob
+import heapq
+import socket
+import signal
+import select
+from sysfs import SysfsAttr
+from history import MetricHistory, SPARK_CHARS
+from spool import Spool
+from array import array
+from emitter import Emitter, quantize
+from scheduler import AdaptiveScheduler
+from pubsub import Broker
+
+UPDATE_INTERVAL = 2
+PRIMARY_COLOR = "#48A3FF"
+WHITE_COLOR = "#FFFFFF"
+WARNING_COLOR = "#ff9a3c"
+CRITICAL_COLOR = "#dc2f2f"
+NEUTRAL_COLOR = "#FFFFFF"
+
+HISTORY_MODES = ['cpu', 'memory', 'gpu']
+PROC_SLOTS = 8192
+BASELINE_MAX_AGE = 30
+CPU_STEP = 1.0  # Quantize CPU percentages so jitter below this doesn't force a redraw
+MEM_STEP = 0.5  # Likewise for memory and swap percentages
+HOT_PERCENT = 70  # Sample fast above this CPU/GPU busy % (CPU only without PSI)
+MOVING_STEP = 5  # Or when a value moved at least this much since the last sample
+TOOLTIP_REFRESH = 30  # Seconds between rebuilds of the top-process/per-core sections, 0 = every tick
+HOVER_HOLD = 10  # Rebuild them every tick for this long after a hover signal
+
+HEAT_WIDTH = 16  # Cores per heatmap line before wrapping
+PSI_WARNING = 10  # % of the last 10s in which some task stalled on the resource
+PSI_CRITICAL = 40  # Critical only if avg60 is past PSI_WARNING too, so a short spike stays a warning
+PSI_HOT = PSI_WARNING / 2  # Sample fast once avg10 is within reach of PSI_WARNING
+CGROUP_ROOT = '/sys/fs/cgroup'
+UNIT_LAUNCHERS = ('flatpak', 'Hyprland', 'hyprland', 'uwsm', 'niri', 'sway', 'gnome', 'kde')
+
+GPU_PRIMARY = ""  # Driver name or PCI slot of the GPU shown in the bar text, empty = auto
+GPU_RESCAN_INTERVAL = 30  # Seconds between fd-table rescans of known pids for new DRM fds
+
+class CpuStat:
+    """Total and per-core utilisation from one pread of /proc/stat per tick."""
+    def __init__(self):
+        self.file = SysfsAttr('/proc/stat', 65536)
+        self.ncpu = os.cpu_count() or 1
+        self.freq = [SysfsAttr(f'/sys/devices/system/cpu/cpu{i}/cpufreq/scaling_cur_freq') for i in range(self.ncpu)]
+        self.prev = None
+        self.meta = None
+        self.total = 0.0
+        self.per_core = []
+        self.deltas = {}
+        self.primed = False  # The last sample had a baseline to diff against
+
+    def spool_layout(self):
+        return [('cpu-jiffies', 8 + 16 * (self.ncpu + 1))]
+
+    def attach(self, spool):
+        """Keep the jiffy baseline in the spool, picking up a recent one left by a previous run."""
+        region = spool.region('cpu-jiffies')
+        self.meta = region[:8].cast('Q')
+        self.slots = region[8:].cast('Q')
+        n = self.meta[0]
+        if spool.age is not None and spool.age <= BASELINE_MAX_AGE and n:
+            self.prev = [(self.slots[2 * i], self.slots[2 * i + 1]) for i in range(n)]
+
+    def sample(self):
+        """Update total, per_core and the per-cpu (busy, total) jiffy deltas since the previous sample."""
+        data = self.file.read() or ""
+        current, ids = [], []
+        for line in data.split('\n'):
+            if not line.startswith('cpu'): break
+            # user nice system idle iowait irq softirq steal; guest time is already in user/nice
+            f = line.split()
+            ids.append(int(f[0][3:]) if len(f[0]) > 3 else None)
+            f = f[1:9]
+            total = sum(map(int, f))
+            current.append((total - int(f[3]) - int(f[4]), total))
+
+        self.primed = bool(self.prev) and len(self.prev) == len(current)
+        prev = self.prev if self.primed else current
+        deltas = [(busy - pbusy, total - ptotal) for (busy, total), (pbusy, ptotal) in zip(current, prev)]
+        usage = [b / t * 100 if t > 0 else 0.0 for b, t in deltas]
+        self.prev = current
+        if self.meta is not None:
+            n = min(len(current), len(self.slots) // 2)
+            for i in range(n): self.slots[2 * i], self.slots[2 * i + 1] = current[i]
+            self.meta[0] = n
+        self.total = usage[0] if usage else 0.0
+        self.per_core = usage[1:]
+        # Keyed by cpu id: offline cpus have no /proc/stat line, so the index isn't the id
+        self.deltas = dict(zip(ids[1:], deltas[1:]))
+        return self.total
+
+    def frequency(self):
+        """Average scaling_cur_freq across cores in MHz."""
+        khz = [f.read_int() for f in self.freq if f.available]
+        if khz: return sum(khz) / len(khz) / 1000
+        # No cpufreq driver (VMs): fall back to the "cpu MHz" lines
+        try:
+            with open('/proc/cpuinfo', 'r') as f:
+                mhz = [float(line.split(':')[1]) for line in f if line.startswith('cpu MHz')]
+            return sum(mhz) / len(mhz) if mhz else 0.0
+        except (OSError, ValueError): return 0.0
+
+def read_text(path):
+    try:
+        with open(path, 'r') as f: return f.read().strip()
+    except OSError: return None
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cpus = []
+    for part in (text or "").split(','):
+        lo, _, hi = part.partition('-')
+        try: cpus.extend(range(int(lo), int(hi or lo) + 1))
+        except ValueError: continue
+    return cpus
+
+class CpuTopology:
+    """Cores grouped by shared L3 (a CCX on Zen) and by P/E kind on hybrid parts, read once from sysfs.
+
+    `domains` is a list of (label, cores); each core is the tuple of its SMT siblings' cpu ids.
+    """
+    def __init__(self, root='/sys/devices/system/cpu'):
+        kinds = {}
+        for kind, pmu in (('P', 'cpu_core'), ('E', 'cpu_atom')):
+            for cpu in parse_cpulist(read_text(f'/sys/devices/{pmu}/cpus')): kinds[cpu] = kind
+
+        groups = {}
+        cpus = sorted(int(os.path.basename(d)[3:]) for d in glob.glob(f'{root}/cpu[0-9]*'))
+        if not cpus: cpus = list(range(os.cpu_count() or 1))
+        for cpu in cpus:
+            base = f'{root}/cpu{cpu}'
+            siblings = tuple(parse_cpulist(read_text(f'{base}/topology/thread_siblings_list'))) or (cpu,)
+            l3 = read_text(f'{base}/cache/index3/id') or read_text(f'{base}/topology/physical_package_id') or '0'
+            size, cores = groups.setdefault((kinds.get(cpu, ''), l3), (read_text(f'{base}/cache/index3/size'), []))
+            if siblings not in cores: cores.append(siblings)
+
+        self.threads = len(cpus)
+        self.cores = sum(len(cores) for _, cores in groups.values())
+        self.domains = []
+        for (kind, l3), (size, cores) in groups.items():
+            label = {'P': "P-cores", 'E': "E-cores"}.get(kind, "CCX")
+            if not kind or sum(k == kind for k, _ in groups) > 1: label += f" {l3}"
+            if size and size.endswith('K') and size[:-1].isdigit() and int(size[:-1]) % 1024 == 0:
+                size = f"{int(size[:-1]) // 1024}M"
+            if size: label += f" ({size})"
+            self.domains.append((label, cores))
+
+    def aggregate(self, deltas):
+        """[(label, per-core %, domain %)] from per-cpu (busy, total) jiffy deltas; SMT siblings are summed."""
+        out = []
+        for label, cores in self.domains:
+            usages, busy_sum, total_sum = [], 0, 0
+            for core in cores:
+                busy = total = 0
+                for cpu in core:
+                    d = deltas.get(cpu)
+                    if d: busy += d[0]; total += d[1]
+                if not total: continue
+                usages.append(busy / total * 100)
+                busy_sum += busy
+                total_sum += total
+            if usages: out.append((label, usages, busy_sum / total_sum * 100))
+        return out
+
+def heat_color(percent):
+    return CRITICAL_COLOR if percent > 90 else WARNING_COLOR if percent > 70 else NEUTRAL_COLOR
+
+def heat_row(values):
+    """One block glyph per core, coloured in runs so a 64-core row stays a handful of spans."""
+    out, run, color = [], "", None
+    top = len(SPARK_CHARS) - 1
+    for v in values:
+        c = heat_color(v)
+        if c != color and run:
+            out.append(f"<span color='{color}'>{run}</span>")
+            run = ""
+        color = c
+        run += SPARK_CHARS[min(max(int(v / 100 * top + 0.5), 0), top)]
+    if run: out.append(f"<span color='{color}'>{run}</span>")
+    return "".join(out)
+
+MEMINFO_KEYS = ('MemTotal', 'MemAvailable', 'SwapTotal', 'SwapFree')
+
+class MemInfo:
+    """RAM and swap usage from one pread of /proc/meminfo per tick."""
+    def __init__(self):
+        self.file = SysfsAttr('/proc/meminfo', 8192)
+
+    def sample(self):
+        values = {}
+        for line in (self.file.read() or "").split('\n'):
+            key, _, rest = line.partition(':')
+            if key in MEMINFO_KEYS:
+                values[key] = int(rest.split()[0]) * 1024
+                if len(values) == len(MEMINFO_KEYS): break
+        total = values.get('MemTotal', 0) or 1
+        used = total - values.get('MemAvailable', 0)
+        swap_total = values.get('SwapTotal', 0)
+        swap_used = swap_total - values.get('SwapFree', 0)
+        return {'total': total, 'used': used, 'percent': round(used / total * 100, 1),
+                'swap_total': swap_total, 'swap_percent': round(swap_used / swap_total * 100, 1) if swap_total else 0.0}
+
+class Pressure:
+    """Pressure-stall averages from /proc/pressure/<resource>; sample() is None without PSI."""
+    def __init__(self, resource):
+        self.file = SysfsAttr(f'/proc/pressure/{resource}', 256)
+
+    def sample(self):
+        """(avg10, avg60) of the 'some' line, in percent."""
+        data = self.file.read()
+        if not data or not data.startswith('some'): return None
+        fields = dict(f.split('=') for f in data.split('\n', 1)[0].split()[1:])
+        try: return float(fields['avg10']), float(fields['avg60'])
+        except (KeyError, ValueError): return None
+
+def stall_class(stall):
+    avg10, avg60 = stall
+    if avg10 >= PSI_CRITICAL and avg60 >= PSI_WARNING: return "critical"
+    if avg10 >= PSI_WARNING: return "high"
+    return "normal"
+
+def usage_class(percent):
+    return "critical" if percent > 90 else "high" if percent > 70 else "normal"
+
+CLASS_COLORS = {"critical": CRITICAL_COLOR, "high": WARNING_COLOR}
+
+def user_cgroup_base():
+    """The user manager's cgroup (user@UID.service), from our own cgroup or the usual path."""
+    for line in (read_text('/proc/self/cgroup') or "").split('\n'):
+        path = line[3:] if line.startswith('0::') else ""
+        start = path.find('/user@')
+        if start >= 0: return CGROUP_ROOT + path[:path.index('.service', start) + len('.service')]
+    uid = os.getuid()
+    return f'{CGROUP_ROOT}/user.slice/user-{uid}.slice/user@{uid}.service'
+
+def unit_label(unit):
+    """app-Hyprland-kitty@2.service, app-flatpak-org.mozilla.firefox-4711.scope -> kitty, firefox"""
+    name = unit.rsplit('.', 1)[0].replace('\\x2d', '-').split('@', 1)[0]
+    if name.startswith('app-'): name = name[4:]
+    parts = name.split('-')
+    while len(parts) > 1 and parts[-1].isdigit(): parts.pop()
+    if len(parts) > 1 and parts[0] in UNIT_LAUNCHERS: parts.pop(0)
+    # Reverse-DNS app ids (flatpak, desktop files) keep only the last component
+    return '-'.join(parts).rsplit('.', 1)[-1]
+
+def memory_anon(stat):
+    """The anon field of a memory.stat (the first line in practice), in bytes."""
+    for line in (stat or "").split('\n'):
+        if line.startswith('anon '):
+            try: return int(line[5:])
+            except ValueError: return 0
+    return 0
+
+class CgroupScanner:
+    """Per-app CPU and memory from the cgroup v2 tree instead of a walk over every process.
+
+    Units are the *.scope/*.service leaves under the user manager and system.slice, summed
+    by app name. Each scan re-lists the slices and reads cpu.stat and memory.stat once
+    per unit, keeping the fds of units that are still there. Memory is memory.stat's anon,
+    not memory.current: that includes page cache, which would rank a cache-heavy service
+    above real apps.
+    """
+    def __init__(self):
+        self.available = os.path.exists(f'{CGROUP_ROOT}/cgroup.controllers')
+        self.roots = [user_cgroup_base(), f'{CGROUP_ROOT}/system.slice']
+        self.mem_total = os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        self.units = {}
+        self.prev_usec = {}
+        self.prev_time = None
+        self.cpu = None
+        self.mem = {}
+
+    def walk(self, path, found):
+        try: entries = list(os.scandir(path))
+        except OSError: return
+        for e in entries:
+            if not e.is_dir(follow_symlinks=False): continue
+            if e.name.endswith(('.scope', '.service')): found.append(e.path)
+            elif e.name.endswith('.slice'): self.walk(e.path, found)
+
+    def scan(self):
+        found = []
+        for root in self.roots: self.walk(root, found)
+        units = {}
+        for path in found:
+            units[path] = self.units.pop(path, None) or (
+                unit_label(os.path.basename(path)), SysfsAttr(f'{path}/cpu.stat', 512), SysfsAttr(f'{path}/memory.stat', 8192))
+        for _, cpu_stat, mem_stat in self.units.values():
+            cpu_stat.close()
+            mem_stat.close()
+        self.units = units
+
+        now = time.monotonic()
+        dt = now - self.prev_time if self.prev_time is not None else 0
+        usec, cpu, mem = {}, {}, {}
+        for path, (label, cpu_stat, mem_stat) in units.items():
+            stat = cpu_stat.read()
+            if stat and stat.startswith('usage_usec'):
+                usec[path] = int(stat.split(None, 2)[1])
+                if dt > 0 and path in self.prev_usec:
+                    cpu[label] = cpu.get(label, 0.0) + (usec[path] - self.prev_usec[path]) / 1e4 / dt
+            anon = memory_anon(mem_stat.read())
+            if anon: mem[label] = mem.get(label, 0) + anon
+        self.prev_usec, self.prev_time = usec, now
+        self.cpu = cpu if dt > 0 else None
+        self.mem = mem
+
+    def top_cpu(self, n=5):
+        """None until two scans have given a usage delta."""
+        if self.cpu is None: return None
+        top = heapq.nlargest(n, ((pct, label) for label, pct in self.cpu.items() if pct > 0.5))
+        return [{'name': label, 'cpu_percent': pct} for pct, label in top]
+
+    def top_mem(self, n=5):
+        top = heapq.nlargest(n, ((nbytes, label) for label, nbytes in self.mem.items() if nbytes > self.mem_total * 0.005))
+        return [{'name': label, 'memory_percent': nbytes / self.mem_total * 100} for nbytes, label in top]
+
+class ProcScanner:
+    """Single pass over /proc/<pid>/stat per tick: CPU deltas, RSS and names for every process."""
+    def __init__(self):
+        self.clk_tck = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+        self.mem_total = os.sysconf('SC_PHYS_PAGES') * self.page_size
+        self.prev_ticks = {}
+        self.prev_time = time.monotonic()
+        self.names = {}
+        self.cpu = {}
+        self.rss = {}
+        self.meta = None
+        self.primed = False
+
+    @staticmethod
+    def spool_layout():
+        return [('procs-meta', 16), ('procs-pid', 4 * PROC_SLOTS), ('procs-ticks', 8 * PROC_SLOTS)]
+
+    def attach(self, spool):
+        """Keep the tick baseline in the spool, picking up a recent one left by a previous run."""
+        self.meta = spool.region('procs-meta').cast('d')
+        self.pid_slots = spool.region('procs-pid').cast('I')
+        self.tick_slots = spool.region('procs-ticks').cast('Q')
+        n = int(self.meta[0])
+        if spool.age is not None and spool.age <= BASELINE_MAX_AGE and n:
+            self.prev_ticks = dict(zip(self.pid_slots[:n], self.tick_slots[:n]))
+            self.prev_time = self.meta[1]
+
+    def save(self):
+        n = min(len(self.prev_ticks), PROC_SLOTS)
+        self.pid_slots[:n] = array('I', list(self.prev_ticks)[:n])
+        self.tick_slots[:n] = array('Q', list(self.prev_ticks.values())[:n])
+        self.meta[0], self.meta[1] = n, self.prev_time
+
+    def scan(self):
+        current_time = time.monotonic()
+        time_delta = max(current_time - self.prev_time, 0.1)
+        scale = 100.0 / (self.clk_tck * time_delta)
+        prev_ticks = self.prev_ticks
+        self.primed = bool(prev_ticks)
+        ticks, names, cpu, rss = {}, {}, {}, {}
+
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit(): continue
+            try:
+                fd = os.open(f'/proc/{entry}/stat', os.O_RDONLY)
+                try: data = os.read(fd, 1024)
+                finally: os.close(fd)
+            except OSError: continue
+            # comm may contain spaces and parens, so split after the last ')'
+            rparen = data.rfind(b')')
+            fields = data[rparen + 2:].split()
+            pid = int(entry)
+            total = int(fields[11]) + int(fields[12])
+            ticks[pid] = total
+            names[pid] = data[data.find(b'(') + 1:rparen].decode(errors='replace')
+            rss[pid] = int(fields[21])
+            if pid in prev_ticks: cpu[pid] = (total - prev_ticks[pid]) * scale
+
+        self.prev_ticks, self.names, self.cpu, self.rss = ticks, names, cpu, rss
+        self.prev_time = current_time
+        if self.meta is not None: self.save()
+
+    def top_cpu(self, n=5):
+        top = heapq.nlargest(n, ((pct, pid) for pid, pct in self.cpu.items() if pct > 0.5))
+        return [{'name': self.names[pid], 'pid': pid, 'cpu_percent': pct} for pct, pid in top]
+
+    def top_mem(self, n=5):
+        min_pages = self.mem_total / self.page_size * 0.005
+        top = heapq.nlargest(n, ((pages, pid) for pid, pages in self.rss.items() if pages > min_pages))
+        scale = self.page_size / self.mem_total * 100
+        return [{'name': self.names[pid], 'pid': pid, 'memory_percent': pages * scale} for pages, pid in top]
+
+SIZE_UNITS = {'': 1, 'KiB': 1024, 'MiB': 1024 ** 2, 'GiB': 1024 ** 3}
+
+def parse_size(value):
+    num, _, unit = value.partition(' ')
+    try: return int(num) * SIZE_UNITS.get(unit.strip(), 1)
+    except ValueError: return 0
+
+def parse_fdinfo(path, keys=None):
+    """Read 'key: value' lines from an fdinfo file, stopping as soon as every wanted key has been seen."""
+    info = {}
+    with open(path, 'r') as f:
+        for line in f:
+            key, _, value = line.partition(':')
+            if keys is None or key in keys:
+                info[key] = value.strip()
+                if keys is not None and len(info) == len(keys): break
+    return info
+
+def client_key(info):
+    """(drm-pdev, drm-client-id): the id is only unique per device, so two cards can both have client 5."""
+    cid = info.get('drm-client-id')
+    return None if cid is None else (info.get('drm-pdev'), cid)
+
+class GpuClientIndex:
+    """Remembers which pid/fd pairs are DRM clients, keyed by client_key().
+
+    New pids get their fd table scanned once, known pids only every GPU_RESCAN_INTERVAL
+    seconds and only for fds whose number or target is new. Each tick re-reads just the
+    DRM fdinfo files.
+    """
+    def __init__(self):
+        self.seen_fds = {}
+        self.clients = {}
+        self.next_rescan = time.monotonic() + GPU_RESCAN_INTERVAL
+
+    def scan_pid(self, pid):
+        try: fds = os.listdir(f'/proc/{pid}/fd')
+        except OSError: fds = []
+        # fd -> readlink target, not the bare number: browsers recycle fd numbers, so one
+        # first seen as a socket may be a /dev/dri node by the next rescan
+        prev, seen = self.seen_fds.get(pid, {}), {}
+        for fd in fds:
+            try: seen[fd] = target = os.readlink(f'/proc/{pid}/fd/{fd}')
+            except OSError: continue
+            if prev.get(fd) == target or not target.startswith('/dev/dri/'): continue
+            try: info = parse_fdinfo(f'/proc/{pid}/fdinfo/{fd}', {'drm-driver', 'drm-pdev', 'drm-client-id'})
+            except OSError: continue
+            cid = client_key(info)
+            if cid is not None: self.add(cid, pid, fd)
+        self.seen_fds[pid] = seen
+
+    def add(self, cid, pid, fd):
+        holders = self.clients.setdefault(cid, [])
+        if (pid, fd) not in holders: holders.append((pid, fd))
+
+    def update(self, pids):
+        gone = self.seen_fds.keys() - pids
+        for pid in gone: del self.seen_fds[pid]
+        if gone:
+            for cid in list(self.clients):
+                self.clients[cid] = [h for h in self.clients[cid] if h[0] not in gone]
+                if not self.clients[cid]: del self.clients[cid]
+
+        # Timed rather than counted: ticks stretch with the scheduler and with TOOLTIP_REFRESH
+        now = time.monotonic()
+        if now >= self.next_rescan:
+            rescan = pids
+            self.next_rescan = now + GPU_RESCAN_INTERVAL
+        else: rescan = pids - self.seen_fds.keys()
+        for pid in rescan: self.scan_pid(pid)
+
+    def sample(self, pids):
+        """Yield (pid, client_id, fdinfo) once per DRM client, attributed to its first live holder."""
+        self.update(pids)
+        for cid, holders in list(self.clients.items()):
+            while holders:
+                pid, fd = holders[0]
+                try: info = parse_fdinfo(f'/proc/{pid}/fdinfo/{fd}')
+                except OSError:
+                    # fd closed: forget it so a reopened fd with the same number is rescanned
+                    holders.pop(0)
+                    self.seen_fds.get(pid, {}).pop(fd, None)
+                    continue
+                key = client_key(info)
+                if key is not None and key != cid:
+                    # Closed and reopened on the same node under the same number: another client now
+                    holders.pop(0)
+                    self.add(key, pid, fd)
+                    continue
+                yield pid, cid, info
+                break
+            if not holders: del self.clients[cid]
+
+def fdinfo_memory(info, region):
+    # amdgpu reports drm-memory-*, newer kernels the generic drm-resident-*
+    value = info.get(f'drm-memory-{region}') or info.get(f'drm-resident-{region}')
+    return parse_size(value) if value else 0
+
+class GpuAccounting:
+    """Per-client, per-engine busy-ns counters kept across ticks.
+
+    Work per tick is proportional to the number of DRM clients: each client's
+    drm-engine-<name> counters are diffed against the previous tick, scaled by
+    drm-engine-capacity-<name>, and summed per process.
+    """
+    def __init__(self):
+        self.prev = None
+        self.prev_time = time.monotonic_ns()
+        self.primed = False
+
+    def sample(self, clients):
+        current_time = time.monotonic_ns()
+        time_delta = max(current_time - self.prev_time, 1)
+        current = {}
+        procs = {}
+
+        for pid, cid, info in clients:
+            engines, capacity = {}, {}
+            for key, value in info.items():
+                if key.startswith('drm-engine-capacity-'): capacity[key[20:]] = int(value) or 1
+                elif key.startswith('drm-engine-'): engines[key[11:]] = int(value.split()[0])
+            current[cid] = engines
+
+            p = procs.get(pid)
+            if p is None: p = procs[pid] = {'pid': pid, 'engines': {}, 'vram': 0, 'gtt': 0}
+            p['vram'] += fdinfo_memory(info, 'vram')
+            p['gtt'] += fdinfo_memory(info, 'gtt')
+
+            prev = self.prev.get(cid) if self.prev is not None else None
+            if prev is None: continue
+            for engine, ns in engines.items():
+                delta = ns - prev.get(engine, ns)
+                if delta > 0:
+                    pct = delta / time_delta * 100 / capacity.get(engine, 1)
+                    p['engines'][engine] = p['engines'].get(engine, 0) + pct
+
+        self.primed = self.prev is not None
+        self.prev = current
+        self.prev_time = current_time
+        for p in procs.values(): p['usage'] = min(max(p['engines'].values(), default=0.0), 100.0)
+        return list(procs.values())
+
+class GpuDevice:
+    """One /sys/class/drm/card* device, labelled by driver and PCI id, with its sysfs files held open."""
+    def __init__(self, card):
+        self.card = os.path.basename(card)
+        dev = os.path.join(card, 'device')
+        self.pci_slot = os.path.basename(os.path.realpath(dev))
+        try: self.driver = os.path.basename(os.readlink(os.path.join(dev, 'driver')))
+        except OSError: self.driver = "unknown"
+        # One-off reads: only the per-tick attributes below keep an fd
+        vendor = read_text(os.path.join(dev, 'vendor')) or '0x0000'
+        device = read_text(os.path.join(dev, 'device')) or '0x0000'
+        self.pci_id = f"{vendor[2:]}:{device[2:]}"
+        self.label = f"{self.card} {self.driver} [{self.pci_id}]"
+
+        self.busy = SysfsAttr(os.path.join(dev, 'gpu_busy_percent'))
+        self.mem_used = SysfsAttr(os.path.join(dev, 'mem_info_vram_used'))
+        self.sclk = SysfsAttr(os.path.join(dev, 'pp_dpm_sclk'), 512)
+        try: self.vram_total = int(read_text(os.path.join(dev, 'mem_info_vram_total')) or 0)
+        except ValueError: self.vram_total = 0
+
+    def read(self):
+        clock = 0
+        content = self.sclk.read()
+        if content:
+            m = re.search(r"(\d+)\s*Mhz\s*\*", content)
+            if m: clock = int(m.group(1))
+        return {"usage": self.busy.read_int(), "mem_used": self.mem_used.read_int(),
+                "mem_total": self.vram_total or 1, "clock": clock}
+
+def discover_gpus():
+    """Enumerate DRM cards once, primary first: GPU_PRIMARY match, then ones reporting load, then by VRAM."""
+    gpus = []
+    seen = set()
+    for card in sorted(glob.glob('/sys/class/drm/card[0-9]*'), key=lambda c: int(re.sub(r'\D', '', c) or 0)):
+        dev = os.path.realpath(os.path.join(card, 'device'))
+        if '-' in os.path.basename(card) or dev in seen: continue
+        seen.add(dev)
+        gpus.append(GpuDevice(card))
+    gpus.sort(key=lambda g: (GPU_PRIMARY not in (g.driver, g.pci_slot), not g.busy.available, -g.vram_total))
+    return gpus
+
+class SystemMonitor:
+    def __init__(self, mode, spool_name=None, persist=True):
+        self.mode = mode
+        self.gpu_accounting = GpuAccounting()
+        self.gpus = discover_gpus()
+
+        self.cpu_stat = CpuStat()
+        self.topology = None
+        self.mem_info = MemInfo()
+        layout = [(f'history-{m}', MetricHistory.storage_size(UPDATE_INTERVAL)) for m in HISTORY_MODES]
+        layout += ProcScanner.spool_layout() + self.cpu_stat.spool_layout()
+        self.spool = Spool(spool_name or f"usage-{mode}", layout, persist)
+        self.history = {m: MetricHistory(UPDATE_INTERVAL, storage=self.spool.region(f'history-{m}')) for m in HISTORY_MODES}
+
+        self.cached_gpu_procs = []
+        self.procs = ProcScanner()
+        self.procs.attach(self.spool)
+        self.cpu_stat.attach(self.spool)
+        self.scheduler = AdaptiveScheduler(UPDATE_INTERVAL)
+        self.levels = {}
+        self.detail_cache = {}
+        self.detail_time = {}
+        self.hover_until = 0.0
+        self.hover_pending = False
+        self.procs_scanned = False
+        self.gpu_clients = GpuClientIndex()
+        self.pressure = {r: Pressure(r) for r in ('cpu', 'memory', 'io')}
+        self.cgroups = CgroupScanner()
+        self.cgroups_scanned = False
+        self.snapshot = None
+
+    def read_snapshot(self):
+        """Read CPU, memory and pressure once per tick; every mode rendered until the next tick uses it.
+
+        A second /proc/stat read in the same tick would see a zero jiffy delta (0% for
+        whichever of cpu/combined came second), and a late subscriber's first line would
+        shorten the next tick's delta.
+        """
+        cpu = quantize(self.cpu_stat.sample(), CPU_STEP)
+        mem = self.mem_info.sample()
+        mem['percent'] = quantize(mem['percent'], MEM_STEP)
+        mem['swap_percent'] = quantize(mem['swap_percent'], MEM_STEP)
+        self.history['cpu'].record(cpu)
+        self.history['memory'].record(mem['percent'])
+        self.snapshot = {'cpu': cpu, 'memory': mem, 'pressure': {r: p.sample() for r, p in self.pressure.items()}}
+
+    def scan_procs(self):
+        # One /proc walk per tick, shared by the cpu, memory and gpu views
+        if not self.procs_scanned:
+            self.procs.scan()
+            self.procs_scanned = True
+        return self.procs
+
+    def scan_cgroups(self):
+        if not self.cgroups.available: return None
+        if not self.cgroups_scanned:
+            self.cgroups.scan()
+            self.cgroups_scanned = True
+        return self.cgroups
+
+    def get_top_cpu_procs(self):
+        return self.scan_procs().top_cpu()
+
+    def get_top_mem_procs(self):
+        return self.scan_procs().top_mem()
+
+    def get_top_consumers(self, kind):
+        """(title, entries): apps from the cgroup tree where it can be used, else processes."""
+        cgroups = self.scan_cgroups()
+        top = cgroups and (cgroups.top_cpu() if kind == 'cpu' else cgroups.top_mem())
+        if top is not None: return "Top Apps", top
+        return "Top Processes", self.get_top_cpu_procs() if kind == 'cpu' else self.get_top_mem_procs()
+
+    def pressure_line(self, *resources):
+        """' └─ Stalled: cpu 3.7% (60s 1.7%) …', or "" without PSI."""
+        parts = []
+        for r in resources:
+            stall = self.snapshot['pressure'][r]
+            if stall: parts.append(f"{r} {stall[0]:.1f}% (60s {stall[1]:.1f}%)")
+        return f" └─ Stalled: {', '.join(parts)}\n" if parts else ""
+
+    def get_top_gpu_procs(self):
+        procs = self.scan_procs()
+        results = [p for p in self.gpu_accounting.sample(self.gpu_clients.sample(procs.names.keys()))
+                   if p['usage'] > 0.5 or p['vram'] > 0]
+        for p in results: p['name'] = procs.names.get(p['pid'], str(p['pid']))
+        return heapq.nlargest(5, results, key=lambda x: x['usage'])
+
+    def history_section(self, mode):
+        lines = self.history[mode].summary()
+        if not lines: return ""
+        return f"\n<span color='{PRIMARY_COLOR}'>󰄨 History:</span>\n" + "\n".join(lines) + "\n"
+
+    def hover(self, *_):
+        self.hover_until = time.monotonic() + HOVER_HOLD
+        self.hover_pending = True
+
+    def primed(self, mode):
+        """Whether the mode's detail section had baselines to diff against this tick."""
+        # With cgroups the section is "Top Apps"; a process-list stand-in (a spooled /proc baseline
+        # after a restart) is shown until the second cgroup scan, but not cached
+        if mode == 'cpu': return self.cpu_stat.primed and (self.cgroups.cpu is not None if self.cgroups.available else self.procs.primed)
+        if mode == 'gpu': return self.gpu_accounting.primed
+        return True
+
+    def details(self, mode, build):
+        """Expensive or fast-changing tooltip section, rebuilt every TOOLTIP_REFRESH seconds or every tick while hovered."""
+        now = time.monotonic()
+        if mode not in self.detail_cache or now < self.hover_until or now - self.detail_time[mode] >= TOOLTIP_REFRESH:
+            section = build()
+            # The first sample has no deltas (empty per-core rows, no top processes): show it, rebuild next tick
+            if not self.primed(mode): return section
+            self.detail_cache[mode] = section
+            self.detail_time[mode] = now
+        return self.detail_cache[mode]
+
+    def cpu_details(self):
+        freq = self.cpu_stat.frequency()
+        load = os.getloadavg()
+        title, top_procs = self.get_top_consumers('cpu')
+
+        if self.topology is None: self.topology = CpuTopology()
+        topo = self.topology
+        tt = f"<span color='{PRIMARY_COLOR}'>󰘚 Per-Core ({topo.cores}C/{topo.threads}T):</span>\n"
+        domains = topo.aggregate(self.cpu_stat.deltas)
+        for i, (label, usages, total) in enumerate(domains):
+            last = i == len(domains) - 1
+            tt += f" {'└─' if last else '├─'} {label}: <span color='{heat_color(total)}'>{total:.0f}%</span>\n"
+            for k in range(0, len(usages), HEAT_WIDTH):
+                tt += f" {'  ' if last else '│ '}  {heat_row(usages[k:k + HEAT_WIDTH])}\n"
+
+        tt += f"\n<span color='{PRIMARY_COLOR}'>󰓅 Freq:</span> {freq/1000:.2f}GHz"
+        tt += f"   <span color='{PRIMARY_COLOR}'>󱘲 Load:</span> {load[0]:.2f}\n"
+
+        if top_procs:
+            tt += f"\n<span color='{PRIMARY_COLOR}'>󰍛 {title}:</span>\n"
+            for p in top_procs:
+                col = CRITICAL_COLOR if p['cpu_percent'] > 50 else WARNING_COLOR if p['cpu_percent'] > 25 else NEUTRAL_COLOR
+                tt += f" ├─ {p['name']}: <span color='{col}'>{quantize(p['cpu_percent'], CPU_STEP):.0f}%</span>\n"
+        return tt
+
+    def get_cpu_data(self):
+        total = self.snapshot['cpu']
+        self.levels['cpu'] = total
+
+        # Busy is fine as long as nothing waits: PSI decides the class where the kernel has it
+        stall = self.snapshot['pressure']['cpu']
+        css = stall_class(stall) if stall else usage_class(total)
+        text = f" <span color='{CLASS_COLORS[css]}'>{total:.0f}%</span>" if css in CLASS_COLORS else f" {total:.0f}%"
+
+        tt = f"<span color='{PRIMARY_COLOR}'>󰍛 CPU Usage: {total:.0f}%</span>\n"
+        tt += self.pressure_line('cpu', 'io')
+        tt += self.details('cpu', self.cpu_details)
+        tt += self.details('history-cpu', lambda: self.history_section('cpu'))
+        return {"text": text, "tooltip": tt, "class": css}
+
+    def get_gpu_data(self):
+        if 'gpu' not in self.snapshot:
+            self.snapshot['gpu'] = [(gpu, gpu.read()) for gpu in self.gpus]
+            self.history['gpu'].record(self.snapshot['gpu'][0][1]['usage'] if self.snapshot['gpu'] else 0)
+        stats = self.snapshot['gpu']
+        usage = stats[0][1]['usage'] if stats else 0
+        self.levels['gpu'] = usage
+
+        if usage > 90:
+            text = f"GPU:<span color='{CRITICAL_COLOR}'>{usage}%</span>"
+            css = "critical"
+        elif usage > 70:
+            text = f"GPU:<span color='{WARNING_COLOR}'>{usage}%</span>"
+            css = "high"
+        else:
+            text = f"GPU:{usage}%"
+            css = "normal"
+
+        tt = "" if stats else f"<span color='{PRIMARY_COLOR}'>󰢮 GPU Usage: {usage}%</span>\n"
+        for i, (gpu, g) in enumerate(stats):
+            if i: tt += "\n"
+            label = "GPU" if len(stats) == 1 else gpu.label
+            tt += f"<span color='{PRIMARY_COLOR}'>󰢮 {label} Usage: {g['usage']}%</span>\n"
+            tt += f" ├─ Clock: {g['clock']} MHz\n"
+            tt += f" └─ VRAM: {g['mem_used']/1024/1024/1024:.1f}GiB / {g['mem_total']/1024/1024/1024:.1f}GiB ({(g['mem_used']/max(g['mem_total'], 1))*100:.0f}%)\n"
+
+        tt += self.details('gpu', self.gpu_details)
+        tt += self.details('history-gpu', lambda: self.history_section('gpu'))
+        return {"text": text, "tooltip": tt, "class": css}
+
+    def gpu_details(self):
+        top_procs = self.get_top_gpu_procs()
+        tt = ""
+        if top_procs:
+            tt += f"\n<span color='{PRIMARY_COLOR}'>󰢮 Top Processes:</span>\n"
+            for p in top_procs:
+                col = CRITICAL_COLOR if p['usage'] > 80 else NEUTRAL_COLOR
+                engines = " ".join(f"{e} {pct:.0f}" for e, pct in sorted(p['engines'].items()) if pct >= 1)
+                eng_str = f"[{engines}] " if engines else ""
+                mem_str = f"({p['vram']/1024/1024:.0f}MiB, GTT {p['gtt']/1024/1024:.0f}MiB)" if p['vram'] > 0 else ""
+                tt += f" ├─ {p['name']}: <span color='{col}'>{p['usage']:.0f}%</span> {eng_str}{mem_str}\n"
+        return tt
+
+    def get_mem_data(self):
+        mem = self.snapshot['memory']
+        percent = mem['percent']
+        self.levels['memory'] = percent
+
+        stall = self.snapshot['pressure']['memory']
+        css = stall_class(stall) if stall else usage_class(percent)
+        text = f"<span color='{CLASS_COLORS[css]}'>{percent}%</span>" if css in CLASS_COLORS else f"{percent}%"
+
+        stalled = self.pressure_line('memory')
+        tt = f"<span color='{PRIMARY_COLOR}'>RAM Usage: {percent}%</span>\n"
+        tt += f" ├─ Used: {mem['used']/1024/1024/1024:.1f}GiB\n"
+        tt += f" {'├─' if stalled else '└─'} Total: {mem['total']/1024/1024/1024:.1f}GiB\n"
+        tt += stalled
+        if mem['swap_total'] > 0:
+            tt += f"\n<span color='{PRIMARY_COLOR}'>󰓡 Swap: {mem['swap_percent']}%</span>\n"
+        tt += self.details('memory', self.mem_details)
+        tt += self.details('history-memory', lambda: self.history_section('memory'))
+        return {"text": text, "tooltip": tt, "class": css}
+
+    def mem_details(self):
+        title, top_procs = self.get_top_consumers('memory')
+        tt = ""
+        if top_procs:
+            tt += f"\n<span color='{PRIMARY_COLOR}'>󰅵 {title}:</span>\n"
+            for p in top_procs:
+                col = CRITICAL_COLOR if p['memory_percent'] > 10 else NEUTRAL_COLOR
+                tt += f" ├─ {p['name']}: <span color='{col}'>{p['memory_percent']:.1f}%</span>\n"
+        return tt
+
+    def get_output(self, mode):
+        try:
+            if mode == 'cpu': return self.get_cpu_data()
+            elif mode == 'gpu': return self.get_gpu_data()
+            elif mode == 'memory': return self.get_mem_data()
+            elif mode == 'combined':
+                c = self.get_cpu_data()
+                m = self.get_mem_data()
+                return {"text": f"{c['text']} {m['text']}", "tooltip": c['tooltip'] + "\n\n" + m['tooltip'], "class": "normal"}
+        except Exception as e:
+            return {"text": "Err", "tooltip": str(e)}
+
+    def render(self, mode):
+        """One mode's JSON line from the current tick's snapshot."""
+        if self.snapshot is None: self.read_snapshot()
+        return json.dumps(self.get_output(mode))
+
+    def sample(self, modes):
+        self.procs_scanned = False
+        self.cgroups_scanned = False
+        self.hover_pending = False
+        self.spool.touch()
+        self.read_snapshot()
+        # Only the modes rendered this tick count for the schedule, not ones nobody subscribes to anymore
+        self.levels = {}
+        return {mode: self.render(mode) for mode in modes}
+
+    def schedule(self):
+        return self.scheduler.update(self.hot(), **{m: (v, MOVING_STEP) for m, v in self.levels.items()})
+
+    def hot(self):
+        """Near a class threshold, judged by what decides the class: PSI stalls where the kernel
+        has them, else CPU busy %. Memory use alone never is: a desktop at 75% RAM isn't news."""
+        for mode, level in self.levels.items():
+            stall = self.snapshot['pressure'].get(mode)
+            if stall: hot = stall[0] >= PSI_HOT
+            else: hot = mode != 'memory' and level > HOT_PERCENT
+            if hot: return True
+        return False
+
+    def run(self):
+        emitter = Emitter()
+        wake = watch_hover(self)
+        while True:
+            emitter.emit(self.sample([self.mode])[self.mode])
+            self.schedule()
+            deadline = self.scheduler.deadline()
+            # A SIGUSR1 hover signal interrupts the wait and resamples right away
+            while not self.hover_pending and (timeout := deadline - time.monotonic()) > 0:
+                if select.select([wake], [], [], timeout)[0]: wake.recv(64)
+
+def watch_hover(monitor):
+    """Route SIGUSR1 to monitor.hover and return a socket that becomes readable when it arrives."""
+    wake, wake_w = socket.socketpair()
+    wake.setblocking(False)
+    wake_w.setblocking(False)
+    monitor.wake_w = wake_w
+    signal.set_wakeup_fd(wake_w.fileno())
+    signal.signal(signal.SIGUSR1, monitor.hover)
+    return wake
+
+class UsageServer:
+    """Samples once per tick for every subscribed mode and fans changed JSON lines out through a Broker."""
+    def __init__(self, socket_path, modes, persist=True):
+        self.monitor = SystemMonitor('combined', "usage", persist)
+        self.broker = Broker(socket_path, modes, self.monitor.render, self.message)
+
+    def message(self, message):
+        if message == 'hover': self.monitor.hover()
+
+    def run(self):
+        if not self.broker.acquire(): return
+        wake = watch_hover(self.monitor)
+        self.broker.watch(wake.fileno(), select.POLLIN, lambda fd, events: wake.recv(64))
+        try:
+            while True:
+                for mode, line in self.monitor.sample(self.broker.topics()).items(): self.broker.publish(mode, line)
+                if self.broker.idle(): return
+
+                self.monitor.schedule()
+                self.broker.wait(self.monitor.scheduler.deadline(), lambda: self.monitor.hover_pending)
+        finally: self.broker.close()
+
+def benchmark(ticks):
+    """Compare the per-tick cost of the /proc readers with the psutil calls they replaced."""
+    cpu, mem = CpuStat(), MemInfo()
+    def lean():
+        cpu.sample()
+        cpu.frequency()
+        mem.sample()
+
+    def timed(fn):
+        fn()
+        start = time.perf_counter()
+        for _ in range(ticks): fn()
+        return (time.perf_counter() - start) / ticks * 1e6
+
+    print(f"/proc readers: {timed(lean):8.1f} µs/tick")
+    try:
+        start = time.perf_counter()
+        import psutil
+        print(f"psutil import: {(time.perf_counter() - start) * 1e3:8.1f} ms")
+    except ImportError:
+        print("psutil not installed, skipping the comparison")
+        return
+    def legacy():
+        psutil.cpu_percent(interval=None)
+        psutil.cpu_percent(interval=None, percpu=True)
+        psutil.cpu_freq()
+        psutil.cpu_freq()
+        psutil.virtual_memory()
+        psutil.swap_memory()
+    print(f"psutil:        {timed(legacy):8.1f} µs/tick")